@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from audio import (
+    SAMPLE_RATE, LoudnessNormalizer, Resampler, iter_chunks, read_wav, resample, resample_stream,
+    ulaw_decode, ulaw_encode,
+)
+
+# --- CONFIGURATION ---
+# Any 16-bit PCM WAV can be passed as the first argument; it is used at its own rate and at 8 kHz.
+INPUT_FILE = "audio.wav"
+REPEAT = 5
+FRAME_MS = 20
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    try:
+        import audioop  # stdlib C codec, removed in Python 3.13: used as the reference when present
+    except ImportError:
+        audioop = None
+
+def load() -> tuple:
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), INPUT_FILE)
+    pcm, rate = read_wav(path)
+    return pcm, rate
+
+def bench(name, fn, audio_seconds):
+    fn()  # warm up (tables, allocations)
+    started = time.thread_time()
+    for _ in range(REPEAT):
+        fn()
+    cpu = (time.thread_time() - started) / REPEAT
+    print(f"{name:<52} {cpu * 1000:>9.2f} ms   {audio_seconds / cpu:>10,.0f}x real time per core")
+
+def frames(data, rate):
+    step = rate * FRAME_MS // 1000
+    return [data[i : i + step] for i in range(0, len(data), step)]
+
+def main():
+    pcm, rate = load()
+    pcm8 = resample(pcm, rate, SAMPLE_RATE)
+    ulaw = ulaw_encode(pcm8)
+    seconds = len(pcm) / rate
+    print(f"Input: {seconds:.1f}s at {rate} Hz\n")
+
+    # --- 1. CORRECTNESS: codec against audioop, streaming resampler against one-shot ---
+    if audioop:
+        all_pcm = np.arange(-32768, 32768, dtype=np.int16).tobytes()
+        assert ulaw_encode(np.frombuffer(all_pcm, np.int16)) == audioop.lin2ulaw(all_pcm, 2), "encode mismatch"
+        assert ulaw_decode(bytes(range(256))).tobytes() == audioop.ulaw2lin(bytes(range(256)), 2), "decode mismatch"
+        print("mulaw codec matches audioop for all inputs")
+    streamed = np.concatenate(list(resample_stream(frames(pcm, rate), rate, SAMPLE_RATE)))
+    delay = Resampler(rate, SAMPLE_RATE).delay
+    diff = np.abs(streamed[delay : delay + len(pcm8)].astype(np.int32) - pcm8).max()
+    print(f"streaming resampler (20 ms frames) vs one shot: max sample difference {diff}\n")
+
+    # --- 2. THROUGHPUT ---
+    bench("mulaw decode (8 kHz)", lambda: ulaw_decode(ulaw), len(ulaw) / SAMPLE_RATE)
+    bench("mulaw encode (8 kHz)", lambda: ulaw_encode(pcm8), len(ulaw) / SAMPLE_RATE)
+    bench("mulaw decode, 20 ms memoryview frames",
+          lambda: [ulaw_decode(f) for f in iter_chunks(ulaw, 160)], len(ulaw) / SAMPLE_RATE)
+    bench(f"resample {rate} -> 8000, one shot", lambda: resample(pcm, rate, SAMPLE_RATE), seconds)
+    bench(f"resample {rate} -> 8000, 20 ms frames",
+          lambda: list(resample_stream(frames(pcm, rate), rate, SAMPLE_RATE)), seconds)
+    bench("resample 8000 -> 16000, one shot", lambda: resample(pcm8, SAMPLE_RATE, 16000), len(pcm8) / SAMPLE_RATE)
+    bench("loudness normalize, 20 ms frames",
+          lambda: [LoudnessNormalizer().process(f) for f in iter_chunks(ulaw, 160)], len(ulaw) / SAMPLE_RATE)
+
+    if audioop:
+        print("\nReference (audioop, C):")
+        raw = pcm.tobytes()
+        raw8 = pcm8.tobytes()
+        bench("audioop ulaw2lin", lambda: audioop.ulaw2lin(ulaw, 2), len(ulaw) / SAMPLE_RATE)
+        bench("audioop lin2ulaw", lambda: audioop.lin2ulaw(raw8, 2), len(ulaw) / SAMPLE_RATE)
+        bench(f"audioop ratecv {rate} -> 8000 (no anti-alias filter)",
+              lambda: audioop.ratecv(raw, 2, 1, rate, SAMPLE_RATE, None), seconds)
+
+if __name__ == "__main__":
+    main()
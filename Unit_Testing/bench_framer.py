@@ -0,0 +1,52 @@
+import os
+import sys
+import json
+import time
+import base64
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from framer import MediaFramer, FRAME_SECONDS
+from tts import FRAME_BYTES
+
+# --- CONFIGURATION ---
+INPUT_FILE = "ai_response.raw"  # mulaw reply audio captured by test_flow.py
+STREAM_SID = "MZ00000000000000000000000000000000"
+REPEAT = 50
+
+# --- BEFORE: the original per-chunk loop from main.py ---
+def encode_per_chunk(audio_bytes: bytes) -> list:
+    out = []
+    for i in range(0, len(audio_bytes), FRAME_BYTES):
+        chunk = audio_bytes[i : i + FRAME_BYTES]
+        payload = base64.b64encode(chunk).decode("utf-8")
+        out.append(json.dumps({
+            "event": "media",
+            "streamSid": STREAM_SID,
+            "media": {"payload": payload},
+        }))
+    return out
+
+def cpu_per_audio_second(encode, audio_bytes: bytes) -> float:
+    audio_seconds = len(audio_bytes) / FRAME_BYTES * FRAME_SECONDS
+    start = time.process_time()
+    for _ in range(REPEAT):
+        encode(audio_bytes)
+    return (time.process_time() - start) / (REPEAT * audio_seconds)
+
+def run_bench():
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), INPUT_FILE), "rb") as f:
+        audio_bytes = f.read()
+    print(f"[Setup] {len(audio_bytes)} bytes = {len(audio_bytes) / 8000:.1f} s of audio, x{REPEAT}")
+
+    framer = MediaFramer(None, STREAM_SID)
+    # Both paths must put identical JSON on the wire
+    assert [json.loads(m) for m in framer.encode(audio_bytes)] == [json.loads(m) for m in encode_per_chunk(audio_bytes)]
+
+    before = cpu_per_audio_second(encode_per_chunk, audio_bytes)
+    after = cpu_per_audio_second(framer.encode, audio_bytes)
+    print(f"[Before] {before * 1e6:8.1f} us CPU per audio-second (dict + json.dumps + b64encode per chunk)")
+    print(f"[After]  {after * 1e6:8.1f} us CPU per audio-second (MediaFramer.encode)")
+    print(f"[Result] {before / after:.1f}x less CPU; one core encodes ~{1 / after:,.0f} concurrent calls of audio")
+
+if __name__ == "__main__":
+    run_bench()
@@ -0,0 +1,103 @@
+import os
+import sys
+import json
+import time
+import base64
+import asyncio
+import threading
+from websockets.asyncio.client import connect
+from websockets.asyncio.server import serve
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from inbound import InboundBatcher, media_payload
+from tts import FRAME_BYTES
+
+# --- CONFIGURATION ---
+# A captured Twilio stream (one websocket message per line) can be passed as the first argument.
+# Without one, a stream is synthesized from ai_response.raw in Twilio's wire format.
+INPUT_FILE = "ai_response.raw"
+BATCH_MS = 60
+REPEAT = 5
+SINK_PORT = 8765
+
+def load_stream() -> list:
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding="utf-8") as f:
+            return [line.rstrip("\n") for line in f if line.strip()]
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), INPUT_FILE), "rb") as f:
+        audio = f.read()
+    sid = "MZ00000000000000000000000000000000"
+    msgs = [json.dumps({"event": "start", "sequenceNumber": "1", "start": {"streamSid": sid}, "streamSid": sid},
+                       separators=(",", ":"))]
+    for n, i in enumerate(range(0, len(audio), FRAME_BYTES)):
+        msgs.append(json.dumps({
+            "event": "media",
+            "sequenceNumber": str(n + 2),
+            "media": {"track": "inbound", "chunk": str(n + 1), "timestamp": str(n * 20),
+                      "payload": base64.b64encode(audio[i : i + FRAME_BYTES]).decode("ascii")},
+            "streamSid": sid,
+        }, separators=(",", ":")))
+    msgs.append(json.dumps({"event": "stop", "sequenceNumber": str(len(msgs) + 1), "streamSid": sid},
+                           separators=(",", ":")))
+    return msgs
+
+# --- 1. STAND-IN DEEPGRAM: a local websocket that swallows audio, on its own thread ---
+def start_sink():
+    ready = threading.Event()
+
+    async def swallow(ws):
+        async for _ in ws:
+            pass
+
+    async def main():
+        async with serve(swallow, "127.0.0.1", SINK_PORT):
+            ready.set()
+            await asyncio.Future()
+
+    threading.Thread(target=lambda: asyncio.run(main()), daemon=True).start()
+    ready.wait()
+
+# --- 2. BEFORE: json.loads + b64decode + one send per 20 ms frame (original main.py) ---
+async def relay_per_frame(msgs, dg_ws):
+    for msg in msgs:
+        data = json.loads(msg)
+        event = data.get("event")
+        if event == "media":
+            await dg_ws.send(base64.b64decode(data["media"]["payload"]))
+
+# --- 3. AFTER: fast media path + batched sends ---
+async def relay_batched(msgs, dg_ws):
+    batcher = InboundBatcher(dg_ws.send, BATCH_MS)
+    for msg in msgs:
+        payload = media_payload(msg)
+        if payload is not None:
+            await batcher.add(payload)
+            continue
+        data = json.loads(msg)
+        if data.get("event") == "media":
+            await batcher.add(data["media"]["payload"])
+    await batcher.flush()
+    return batcher.batches
+
+async def run_bench():
+    msgs = load_stream()
+    frames = sum(1 for m in msgs if '"media"' in m)
+    audio_seconds = frames * 0.02
+    print(f"[Setup] {len(msgs)} messages, {audio_seconds:.1f} s of caller audio, x{REPEAT}")
+    start_sink()
+
+    async with connect(f"ws://127.0.0.1:{SINK_PORT}") as dg_ws:
+        results = {}
+        for name, relay in (("before", relay_per_frame), ("after", relay_batched)):
+            start = time.thread_time()  # relay thread only; the sink runs on another thread
+            for _ in range(REPEAT):
+                sends = await relay(msgs, dg_ws)
+            results[name] = (time.thread_time() - start) / (REPEAT * audio_seconds)
+            sends = frames if sends is None else sends
+            print(f"[{name.title():6}] {results[name] * 1e6:7.1f} us CPU per audio-second, "
+                  f"{sends} sends -> ~{1 / results[name]:,.0f} calls per core")
+
+    print(f"[Result] {results['before'] / results['after']:.1f}x less relay CPU with {BATCH_MS} ms batches")
+
+if __name__ == "__main__":
+    asyncio.run(run_bench())
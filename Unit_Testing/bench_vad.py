@@ -0,0 +1,102 @@
+import os
+import sys
+import json
+import time
+import asyncio
+from dotenv import load_dotenv
+from websockets.asyncio.client import connect
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from vad import SilenceGate
+from speculation import normalized_distance
+from inbound import BYTES_PER_MS
+from audio import strip_wav_header
+
+# --- CONFIGURATION ---
+# Raw 8 kHz mulaw call audio can be passed as the first argument (a WAV header, if any, is skipped).
+# The recording is played twice with GAP_SECONDS of line silence before and between, the way a
+# caller sits quiet while the assistant talks.
+INPUT_FILE = "ai_response.raw"
+GAP_SECONDS = 8
+BATCH_MS = 60
+SUPPRESS_AFTER = 2.5
+# With DEEPGRAM_API_KEY set, both versions are transcribed and compared (sent at SPEEDUP x real time)
+SPEEDUP = 4
+
+load_dotenv()
+DEEPGRAM_STT_URL = (
+    "wss://api.deepgram.com/v1/listen?"
+    "encoding=mulaw&sample_rate=8000&channels=1"
+    "&smart_formatting=true&interim_results=true&endpointing=1000&utterance_end_ms=1000"
+)
+
+def load_audio() -> bytes:
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), INPUT_FILE)
+    with open(path, "rb") as f:
+        audio = strip_wav_header(f.read())
+    silence = b"\xff" * (GAP_SECONDS * 8000)
+    return silence + audio + silence + audio + silence
+
+def batches(audio: bytes) -> list:
+    step = BATCH_MS * BYTES_PER_MS
+    return [audio[i : i + step] for i in range(0, len(audio), step)]
+
+# --- 1. GATE: what would reach Deepgram, and what it costs ---
+async def run_gate(chunks):
+    sent = []
+
+    async def send(data):
+        sent.append(data)
+
+    gate = SilenceGate(send, suppress_after=SUPPRESS_AFTER)
+    started = time.thread_time()
+    for chunk in chunks:
+        await gate(chunk)
+    return gate, sent, time.thread_time() - started
+
+# --- 2. TRANSCRIBE: stream a message list to Deepgram, collect the finals ---
+async def transcribe(messages, api_key) -> str:
+    finals = []
+    async with connect(DEEPGRAM_STT_URL, additional_headers={"Authorization": f"Token {api_key}"}) as ws:
+        async def receive():
+            async for message in ws:
+                data = json.loads(message)
+                if data.get("type", "Results") == "Results" and data.get("is_final"):
+                    text = data["channel"]["alternatives"][0].get("transcript", "").strip()
+                    if text:
+                        finals.append(text)
+
+        receiver = asyncio.create_task(receive())
+        for msg in messages:
+            await ws.send(msg)
+            if isinstance(msg, bytes):
+                await asyncio.sleep(len(msg) / 8000 / SPEEDUP)
+        await ws.send(json.dumps({"type": "CloseStream"}))
+        await asyncio.wait_for(receiver, 30)
+    return " ".join(finals)
+
+async def main():
+    audio = load_audio()
+    chunks = batches(audio)
+    gate, sent, cpu = await run_gate(chunks)
+    seconds = len(audio) / 8000
+    keepalives = sum(isinstance(m, str) for m in sent)
+
+    print(f"Audio: {seconds:.1f}s in {len(chunks)} batches of {BATCH_MS} ms")
+    print(f"Sent to STT:   {gate.sent_bytes:>9,} bytes")
+    print(f"Suppressed:    {gate.suppressed_bytes:>9,} bytes ({gate.suppressed_bytes / len(audio):.0%})")
+    print(f"KeepAlives:    {keepalives:>9}")
+    print(f"Speech starts: {gate.speech_starts:>9}")
+    print(f"VAD CPU:       {cpu * 1000:>9.1f} ms ({cpu / seconds * 100:.3f}% of one core per call)")
+
+    api_key = os.getenv("DEEPGRAM_API_KEY")
+    if not api_key:
+        print("\nDEEPGRAM_API_KEY not set; skipping the transcript comparison.")
+        return
+    full, gated = await asyncio.gather(transcribe(chunks, api_key), transcribe(sent, api_key))
+    print(f"\nFull stream:  {full}")
+    print(f"Gated stream: {gated}")
+    print(f"Transcript difference (normalized edit distance): {normalized_distance(full, gated):.3f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
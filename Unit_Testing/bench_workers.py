@@ -0,0 +1,51 @@
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from load_test import run_load, pct
+
+# --- CONFIGURATION ---
+# How many concurrent calls the server carries, per worker count, before replies slow down.
+# For each worker count the call count is stepped up until a step breaks the budget; the last
+# step within it is that configuration's capacity. Uses load_test.py (fakes, real app), so
+# several runs of ~25 s each. Workers only add capacity up to the machine's core count, and
+# the load generator itself needs CPU too.
+WORKER_COUNTS = [1, 2, 4]
+CALL_STEPS = [10, 20, 40, 80, 160, 320]
+TURNS = 1
+TTFA_P95_BUDGET = 2.5  # seconds, caller stops talking -> first audio (includes 1 s endpointing)
+LATE_FRAMES_BUDGET = 0.01  # fraction of reply frames arriving after their playout time
+
+def within_budget(r: dict) -> bool:
+    p95 = pct(r["ttfa"], 0.95)
+    return (not r["failed"] and not r["missing"] and p95 is not None and p95 <= TTFA_P95_BUDGET
+            and r["stalls"] <= LATE_FRAMES_BUDGET * max(1, len(r["late"])))
+
+async def main():
+    print(f"{os.cpu_count()} CPU(s); budget: p95 time to first audio <= {TTFA_P95_BUDGET * 1000:.0f} ms, "
+          f"<= {LATE_FRAMES_BUDGET:.0%} late frames, no failed calls\n")
+    print(f"{'workers':>7} {'calls':>6} {'ttfa p50':>9} {'ttfa p95':>9} {'late':>6} {'failed':>6} "
+          f"{'cpu/call':>9} {'MB/call':>8}")
+    capacity = {}
+    for workers in WORKER_COUNTS:
+        capacity[workers] = 0
+        for calls in CALL_STEPS:
+            r = await run_load(calls, TURNS, workers, quiet=True)
+            ok = within_budget(r)
+            p50, p95 = pct(r["ttfa"], 0.5), pct(r["ttfa"], 0.95)
+            print(f"{workers:>7} {calls:>6} {(p50 or 0) * 1000:>7.0f}ms {(p95 or 0) * 1000:>7.0f}ms "
+                  f"{r['stalls'] / max(1, len(r['late'])):>6.1%} {len(r['failed']) + r['missing']:>6} "
+                  f"{100 * r['cpu'] / r['elapsed'] / calls:>8.2f}% "
+                  f"{(r['peak_rss'] - r['rss_before']) / calls:>8.2f}{'' if ok else '  over budget'}")
+            if not ok:
+                break
+            capacity[workers] = calls
+
+    print("\n--- Concurrent calls within budget ---")
+    base = capacity[WORKER_COUNTS[0]] or 1
+    for workers, calls in capacity.items():
+        print(f"{workers} worker(s): {calls} calls ({calls / base:.1f}x)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
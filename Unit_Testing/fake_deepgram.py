@@ -0,0 +1,162 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request, WebSocket
+from fastapi.responses import StreamingResponse
+from fastapi.websockets import WebSocketDisconnect
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from vad import VoiceActivityDetector
+from audio import ulaw_encode, SAMPLE_RATE
+
+# --- CONFIGURATION ---
+# A local stand-in for Deepgram: the /v1/listen STT websocket and the /v1/speak TTS endpoint.
+# Point the voice server at it with:
+#   DEEPGRAM_STT_BASE_URL=ws://127.0.0.1:8082 DEEPGRAM_TTS_BASE_URL=http://127.0.0.1:8082
+# STT does not recognise anything: a local VAD finds the caller's utterances in the audio it is
+# sent, and each one is "transcribed" as the next line of the script, word by word as interims
+# while the caller talks, then as a final once ENDPOINTING_MS of silence has gone by.
+PORT = int(os.getenv("FAKE_DEEPGRAM_PORT", 8082))
+STT_LATENCY_MS = int(os.getenv("FAKE_STT_LATENCY_MS", 150))  # delay on every STT message
+STT_JITTER_MS = int(os.getenv("FAKE_STT_JITTER_MS", 50))  # up to this much extra
+ENDPOINTING_MS = int(os.getenv("FAKE_STT_ENDPOINTING_MS", 1000))
+WORD_MS = int(os.getenv("FAKE_STT_WORD_MS", 300))  # speech per interim word
+SCRIPT = [s.strip() for s in os.getenv("FAKE_STT_SCRIPT", "").split("|") if s.strip()] or [
+    "Hello I need help my father collapsed in the kitchen",
+    "He is not breathing and his lips are blue",
+    "We are at 42 Baker Street second floor",
+    "Okay I am pushing on his chest now",
+]
+TTS_LATENCY_MS = int(os.getenv("FAKE_TTS_LATENCY_MS", 200))  # time to first audio byte
+TTS_JITTER_MS = int(os.getenv("FAKE_TTS_JITTER_MS", 50))
+TTS_CHUNK_MS = int(os.getenv("FAKE_TTS_CHUNK_MS", 20))  # gap between 200 ms chunks of audio
+TTS_SECONDS_PER_WORD = float(os.getenv("FAKE_TTS_SECONDS_PER_WORD", 0.3))
+
+app = FastAPI()
+stats = {"stt_connections": 0, "stt_bytes": 0, "stt_finals": 0, "tts_requests": 0, "tts_bytes": 0}
+
+def delay(ms: int, jitter_ms: int) -> float:
+    return (ms + random.uniform(0, jitter_ms)) / 1000
+
+# --- 1. CANNED AUDIO ---
+# A quiet two-tone "voice", one second of it, looped to whatever length a reply needs
+_t = np.arange(SAMPLE_RATE) / SAMPLE_RATE
+TONE = ulaw_encode((3000 * (np.sin(2 * np.pi * 220 * _t) + 0.5 * np.sin(2 * np.pi * 330 * _t))).astype(np.int16))
+
+def speech_audio(text: str) -> bytes:
+    n = int(max(1, len(text.split())) * TTS_SECONDS_PER_WORD * SAMPLE_RATE)
+    return (TONE * (n // len(TONE) + 1))[:n]
+
+# --- 2. STT ---
+def results(transcript: str, is_final: bool, speech_final: bool, start: float, duration: float) -> str:
+    return json.dumps({
+        "type": "Results",
+        "channel_index": [0, 1],
+        "start": round(start, 2),
+        "duration": round(duration, 2),
+        "is_final": is_final,
+        "speech_final": speech_final,
+        "channel": {"alternatives": [{"transcript": transcript, "confidence": 0.99, "words": []}]},
+    })
+
+class ScriptedRecognizer:
+    """Turns VAD flags for incoming audio into interim/final results for the script's lines."""
+
+    def __init__(self, emit):
+        self.emit = emit
+        self.vad = VoiceActivityDetector()
+        self.frames = 0  # audio received, in 20 ms frames
+        self.line = 0
+        self.speech_frames = 0
+        self.silence_frames = 0
+        self.started = None
+        self.words_sent = 0
+
+    def feed(self, audio: bytes):
+        for speaking in self.vad.process(audio):
+            self.frames += 1
+            if speaking:
+                if self.started is None:
+                    self.started = self.frames
+                self.speech_frames += 1
+                self.silence_frames = 0
+                words = SCRIPT[self.line % len(SCRIPT)].split()
+                due = min(len(words) - 1, self.speech_frames * 20 // WORD_MS)
+                if due > self.words_sent:
+                    self.words_sent = due
+                    self.emit(results(" ".join(words[:due]), False, False, *self._span()))
+            elif self.started is not None:
+                self.silence_frames += 1
+                if self.silence_frames * 20 >= ENDPOINTING_MS:
+                    self.emit(results(SCRIPT[self.line % len(SCRIPT)], True, True, *self._span()))
+                    stats["stt_finals"] += 1
+                    self.line += 1
+                    self.speech_frames = self.silence_frames = self.words_sent = 0
+                    self.started = None
+
+    def _span(self):
+        return self.started * 0.02, (self.frames - self.started) * 0.02
+
+@app.websocket("/v1/listen")
+async def listen(websocket: WebSocket):
+    await websocket.accept()
+    stats["stt_connections"] += 1
+    outbox = asyncio.Queue()
+    last_due = 0.0
+
+    def emit(message: str):
+        # Every message is delayed, but never overtakes the one before it
+        nonlocal last_due
+        last_due = max(last_due, time.monotonic() + delay(STT_LATENCY_MS, STT_JITTER_MS))
+        outbox.put_nowait((last_due, message))
+
+    async def sender():
+        while True:
+            due, message = await outbox.get()
+            await asyncio.sleep(max(0.0, due - time.monotonic()))
+            await websocket.send_text(message)
+
+    recognizer = ScriptedRecognizer(emit)
+    send_task = asyncio.create_task(sender())
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                stats["stt_bytes"] += len(message["bytes"])
+                recognizer.feed(message["bytes"])
+            # Text frames are KeepAlive / CloseStream; nothing to answer
+    except WebSocketDisconnect:
+        pass
+    finally:
+        send_task.cancel()
+
+# --- 3. TTS ---
+@app.post("/v1/speak")
+async def speak(request: Request):
+    stats["tts_requests"] += 1
+    text = (await request.json()).get("text", "")
+    audio = speech_audio(text)
+    stats["tts_bytes"] += len(audio)
+
+    async def body():
+        await asyncio.sleep(delay(TTS_LATENCY_MS, TTS_JITTER_MS))
+        for i in range(0, len(audio), 1600):
+            if i:
+                await asyncio.sleep(delay(TTS_CHUNK_MS, TTS_JITTER_MS // 4))
+            yield audio[i : i + 1600]
+
+    return StreamingResponse(body(), media_type="audio/basic")
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=PORT, log_level="warning")
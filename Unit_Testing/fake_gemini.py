@@ -0,0 +1,138 @@
+import os
+import re
+import json
+import random
+import asyncio
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# --- CONFIGURATION ---
+# A local stand-in for the Gemini REST API (generateContent, streamGenerateContent, countTokens, cachedContents).
+# Point a client at it with:
+#   genai.Client(api_key="fake", http_options=types.HttpOptions(base_url="http://127.0.0.1:8081"))
+PORT = int(os.getenv("FAKE_GEMINI_PORT", 8081))
+LATENCY_MS = int(os.getenv("FAKE_GEMINI_LATENCY_MS", 300))  # time to first token
+CHUNK_MS = int(os.getenv("FAKE_GEMINI_CHUNK_MS", 40))  # gap between streamed chunks
+JITTER_MS = int(os.getenv("FAKE_GEMINI_JITTER_MS", 0))  # up to this much extra on every delay
+ERROR_RATE = float(os.getenv("FAKE_GEMINI_ERROR_RATE", 0))  # fraction of requests answered 429
+BAD_JSON_RATE = float(os.getenv("FAKE_GEMINI_BAD_JSON_RATE", 0))  # fraction of JSON replies truncated
+
+app = FastAPI()
+stats = {"requests": 0, "errors": 0, "bad_json": 0}
+
+# --- 1. CANNED CONTENT ---
+DANGERS = ("fire", "gas", "smoke", "flood", "traffic", "collapse")
+CRITICAL = ("not breathing", "unconscious", "ground", "bleeding", "ambulance", "heart", "fire")
+
+def prompt_text(body) -> str:
+    parts = [p.get("text", "") for c in body.get("contents", []) for p in c.get("parts", [])]
+    return " ".join(parts)
+
+def incident_for(text: str) -> dict:
+    lower = text.lower()
+    people = re.search(r"\b(\d+|two|three|four) (people|persons|adults|children)\b", lower)
+    return {
+        "caller_name": "N/A",
+        "emergency_type": "critical" if any(k in lower for k in CRITICAL) else "non-fatal",
+        "location": "N/A",
+        "number_of_people_involved": 2 if people else 1,
+        "age_group": "adult",
+        "immediate_dangers": next((d for d in DANGERS if d in lower), "N/A"),
+        "medical_conditions": "N/A",
+        "description": "Caller reports an emergency and asks for help.",
+    }
+
+def structured_reply(body) -> str:
+    schema = body.get("generationConfig", {}).get("responseSchema", {})
+    properties = schema.get("properties", {})
+    if "ready_to_dispatch" in properties:
+        reply = {"ready_to_dispatch": False, "follow_up_question": "What is the exact address?"}
+    else:
+        reply = incident_for(prompt_text(body))
+    text = json.dumps(reply)
+    if random.random() < BAD_JSON_RATE:
+        stats["bad_json"] += 1
+        text = text[: len(text) // 2]
+    return text
+
+def chat_reply(body) -> list:
+    return ["Okay, I'm here to help. ", "Is the person breathing? ", "Stay on the line."]
+
+def response(text: str, prompt_tokens: int, output_tokens: int, final: bool = True) -> dict:
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+    if final:
+        candidate["finishReason"] = "STOP"
+    return {
+        "candidates": [candidate],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": output_tokens,
+            "totalTokenCount": prompt_tokens + output_tokens,
+        },
+        "modelVersion": "fake-gemini",
+    }
+
+def delay(ms: int) -> float:
+    return (ms + random.uniform(0, JITTER_MS)) / 1000
+
+def rate_limited():
+    if random.random() < ERROR_RATE:
+        stats["errors"] += 1
+        return JSONResponse(
+            {"error": {"code": 429, "message": "Resource exhausted (fake)", "status": "RESOURCE_EXHAUSTED"}},
+            status_code=429,
+        )
+    return None
+
+# --- 2. ROUTES ---
+@app.post("/{version}/models/{model_action}")
+async def models(version: str, model_action: str, request: Request):
+    stats["requests"] += 1
+    body = await request.json()
+    if (error := rate_limited()) is not None:
+        return error
+    prompt_tokens = len(prompt_text(body)) // 4 + 1
+    _, _, action = model_action.partition(":")
+    await asyncio.sleep(delay(LATENCY_MS))
+
+    if action == "generateContent":
+        if "responseSchema" in body.get("generationConfig", {}):
+            text = structured_reply(body)
+        else:
+            text = "".join(chat_reply(body))
+        return response(text, prompt_tokens, len(text) // 4 + 1)
+
+    if action == "countTokens":
+        return {"totalTokens": prompt_tokens}
+
+    if action == "streamGenerateContent":
+        chunks = chat_reply(body)
+
+        async def events():
+            for i, chunk in enumerate(chunks):
+                if i:
+                    await asyncio.sleep(delay(CHUNK_MS))
+                last = i == len(chunks) - 1
+                data = response(chunk, prompt_tokens, len(chunk) // 4 + 1, final=last)
+                yield f"data: {json.dumps(data)}\r\n\r\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return JSONResponse({"error": {"code": 404, "message": f"unknown action {action}"}}, status_code=404)
+
+@app.post("/{version}/cachedContents")
+async def create_cache(version: str, request: Request):
+    body = await request.json()
+    return {"name": "cachedContents/fake", "model": body.get("model"), "displayName": body.get("displayName")}
+
+@app.delete("/{version}/cachedContents/{name}")
+async def delete_cache(version: str, name: str):
+    return {}
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=PORT, log_level="warning")
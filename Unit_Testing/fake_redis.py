@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from store import read_reply, StoreError
+
+# --- CONFIGURATION ---
+# A local stand-in for Redis, speaking just enough RESP for store.RedisStore
+# (PING, AUTH, SELECT, GET, SET [EX|PX] [NX], DEL, EXISTS, DBSIZE, FLUSHALL). Point the server at it with:
+#   SHARED_STORE_URL=redis://127.0.0.1:6390
+PORT = int(os.getenv("FAKE_REDIS_PORT", 6390))
+
+data = {}  # key -> (value, expires at or None)
+
+def alive(key: bytes):
+    item = data.get(key)
+    if item is not None and item[1] is not None and item[1] <= time.monotonic():
+        del data[key]
+        return None
+    return item
+
+def bulk(value) -> bytes:
+    return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+# --- 1. COMMANDS ---
+def command(args: list) -> bytes:
+    name = args[0].upper()
+    if name == b"PING":
+        return b"+PONG\r\n"
+    if name in (b"AUTH", b"SELECT", b"FLUSHALL"):
+        if name == b"FLUSHALL":
+            data.clear()
+        return b"+OK\r\n"
+    if name == b"GET":
+        item = alive(args[1])
+        return bulk(item[0] if item else None)
+    if name == b"SET":
+        key, value, options = args[1], args[2], [a.upper() for a in args[3:]]
+        expires = None
+        for unit, scale in ((b"EX", 1.0), (b"PX", 0.001)):
+            if unit in options:
+                expires = time.monotonic() + float(options[options.index(unit) + 1]) * scale
+        if b"NX" in options and alive(key) is not None:
+            return b"$-1\r\n"
+        data[key] = (value, expires)
+        return b"+OK\r\n"
+    if name in (b"DEL", b"EXISTS"):
+        found = [key for key in args[1:] if alive(key) is not None]
+        if name == b"DEL":
+            for key in found:
+                del data[key]
+        return b":%d\r\n" % len(found)
+    if name == b"DBSIZE":
+        return b":%d\r\n" % sum(1 for key in list(data) if alive(key) is not None)
+    return b"-ERR unknown command '%s'\r\n" % name
+
+# --- 2. SERVER ---
+async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            try:
+                args = await read_reply(reader)
+                if not isinstance(args, list) or not args:
+                    reply = b"-ERR expected a command array\r\n"
+                else:
+                    reply = command(args)
+            except StoreError as e:
+                reply = b"-ERR %s\r\n" % str(e).encode()
+            except (IndexError, ValueError):
+                reply = b"-ERR wrong number of arguments\r\n"
+            writer.write(reply)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def main():
+    server = await asyncio.start_server(handle, "127.0.0.1", PORT)
+    print(f"Fake Redis listening on 127.0.0.1:{PORT}")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    asyncio.run(main())
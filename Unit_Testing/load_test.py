@@ -0,0 +1,330 @@
+import os
+import re
+import sys
+import json
+import time
+import base64
+import asyncio
+import tempfile
+import subprocess
+import httpx
+from websockets.asyncio.client import connect
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from audio import read_wav, resample, ulaw_encode, strip_wav_header, SAMPLE_RATE
+from tts import FRAME_BYTES
+from recorder import Recording, INBOUND
+
+# --- CONFIGURATION ---
+# Opens CALLS simulated Twilio media streams against the real app (main:app under uvicorn),
+# with Deepgram and Gemini replaced by the local fakes, and reports time to first audio,
+# playout jitter and the server's CPU and memory per call. Usage:
+#   python load_test.py [calls] [turns] [workers]
+# With more than one worker the workers share state through the fake Redis (fake_redis.py).
+# Each turn replays the recording at real-time pace, then GAP_SECONDS of line silence while
+# the assistant answers. Fake latencies are set with the fakes' own FAKE_* variables.
+INPUT_FILE = "audio.wav"  # a WAV at any rate, raw 8 kHz mulaw, or a call recording ring (.rec, caller side)
+CALLS = 20
+TURNS = 2
+WORKERS = 1
+GAP_SECONDS = 8
+RAMP_SECONDS = 5  # calls start spread over this long
+APP_PORT = 8090
+GEMINI_PORT = 8091
+DEEPGRAM_PORT = 8092
+REDIS_PORT = 8093
+# 0 keeps every reply out of the TTS cache, so each sentence pays a (fake) synthesis
+TTS_CACHE_MAX_BYTES = 0
+# Have the server record every call (RECORDING_DIR in a temp dir), to see what recording costs
+RECORDING = os.getenv("LOAD_TEST_RECORDING", "0") == "1"
+REPLY_GAP = 0.5  # the playout buffer empty for longer than this: the next frame starts a new reply
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+
+# --- 1. AUDIO ---
+def load_audio() -> bytes:
+    path = os.path.join(HERE, INPUT_FILE)
+    if path.endswith(".rec"):
+        with Recording(path) as recording:
+            return b"".join(audio for _, _, audio in recording.frames(INBOUND))
+    if path.endswith(".wav"):
+        pcm, rate = read_wav(path)
+        return ulaw_encode(resample(pcm, rate, SAMPLE_RATE))
+    with open(path, "rb") as f:
+        return strip_wav_header(f.read())
+
+def frames(audio: bytes) -> list:
+    return [base64.b64encode(audio[i : i + FRAME_BYTES]).decode("ascii")
+            for i in range(0, len(audio) - FRAME_BYTES + 1, FRAME_BYTES)]
+
+# --- 2. PROCESSES ---
+def spawn(args, env) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, *args], cwd=ROOT, env={**os.environ, **env},
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+async def wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as http:
+        while True:
+            try:
+                await http.get(url)
+                return
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{url} did not come up")
+                await asyncio.sleep(0.2)
+
+def proc_stat(pid: int) -> list:
+    with open(f"/proc/{pid}/stat") as f:
+        return f.read().rsplit(")", 1)[1].split()  # fields from 3 (state) on
+
+class ProcessStats:
+    """CPU seconds and resident memory of a process and its children (uvicorn workers), from /proc."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.tick = os.sysconf("SC_CLK_TCK")
+
+    def pids(self) -> list:
+        parents = {}
+        for entry in os.listdir("/proc"):
+            if entry.isdigit():
+                try:
+                    parents[int(entry)] = int(proc_stat(int(entry))[1])
+                except (OSError, IndexError):
+                    continue
+        tree = [self.pid]
+        for pid in tree:
+            tree.extend(child for child, parent in parents.items() if parent == pid)
+        return tree
+
+    def _sum(self, read) -> float:
+        total = 0.0
+        for pid in self.pids():
+            try:
+                total += read(pid)
+            except OSError:
+                continue  # exited meanwhile
+        return total
+
+    def cpu_seconds(self) -> float:
+        return self._sum(lambda pid: sum(int(v) for v in proc_stat(pid)[11:13]) / self.tick)  # utime + stime
+
+    def rss_mb(self) -> float:
+        def rss(pid):
+            with open(f"/proc/{pid}/status") as f:
+                return int(re.search(r"VmRSS:\s+(\d+)", f.read()).group(1)) / 1024
+        return self._sum(rss)
+
+# --- 3. ONE CALL ---
+class CallResult:
+    def __init__(self):
+        self.speech_ends = []  # when the caller's last frame of each turn was sent
+        self.media = []  # (arrival, seconds of audio) per outbound media message
+        self.clears = 0
+        self.error = None
+
+    def first_audio(self) -> list:
+        """Caller stops talking -> first reply frame, per turn (None if no reply came)."""
+        latencies = []
+        for i, end in enumerate(self.speech_ends):
+            until = self.speech_ends[i + 1] if i + 1 < len(self.speech_ends) else float("inf")
+            first = next((t for t, _ in self.media if end < t < until), None)
+            latencies.append(None if first is None else first - end)
+        return latencies
+
+    def lateness(self) -> list:
+        """
+        How late each reply frame arrived for gapless playout at the caller, as Twilio
+        plays it: a frame queued behind earlier ones is 0, one arriving after the
+        buffer ran dry adds an audible gap. First frames of a reply are not counted.
+        """
+        late = []
+        clock = None
+        for arrival, seconds in self.media:
+            if clock is None or arrival - clock > REPLY_GAP:
+                clock = arrival
+            else:
+                late.append(max(0.0, arrival - clock))
+                clock = max(clock, arrival)
+            clock += seconds
+        return late
+
+async def run_call(n: int, audio_frames: list, turns: int = TURNS) -> CallResult:
+    result = CallResult()
+    stream_sid = f"MZ{n:032x}"  # Twilio-shaped, so the server will record it
+    async with httpx.AsyncClient() as http:
+        await http.post(f"http://127.0.0.1:{APP_PORT}/incoming_call")
+    try:
+        async with connect(f"ws://127.0.0.1:{APP_PORT}/audio_stream", max_size=None) as ws:
+            loop = asyncio.get_running_loop()
+            played = {"until": 0.0}  # simulated end of Twilio's playout buffer
+
+            async def echo(mark: dict):
+                try:
+                    await ws.send(json.dumps(mark))
+                except Exception:
+                    pass  # the call ended before this audio would have finished playing
+
+            async def receive():
+                async for message in ws:
+                    now = loop.time()
+                    data = json.loads(message)
+                    event = data.get("event")
+                    if event == "media":
+                        seconds = len(base64.b64decode(data["media"]["payload"])) / SAMPLE_RATE
+                        result.media.append((now, seconds))
+                        played["until"] = max(played["until"], now) + seconds
+                    elif event == "mark":
+                        # Twilio echoes a mark once the audio sent before it has played
+                        loop.call_later(max(0.0, played["until"] - now),
+                                        lambda m=data: asyncio.ensure_future(echo(m)))
+                    elif event == "clear":
+                        result.clears += 1
+                        played["until"] = now
+
+            receiver = asyncio.create_task(receive())
+            await ws.send(json.dumps({"event": "connected", "protocol": "Call", "version": "1.0.0"}))
+            await ws.send(json.dumps({"event": "start", "start": {"streamSid": stream_sid, "callSid": f"CA{n:05d}"},
+                                      "streamSid": stream_sid}))
+            silence = base64.b64encode(b"\xff" * FRAME_BYTES).decode("ascii")
+
+            def media(seq: int, payload: str) -> str:
+                # Compact, "event" first, as Twilio sends it, so the server takes its fast path
+                return json.dumps({"event": "media", "sequenceNumber": str(seq),
+                                   "media": {"track": "inbound", "chunk": str(seq), "timestamp": str(seq * 20),
+                                             "payload": payload},
+                                   "streamSid": stream_sid}, separators=(",", ":"))
+
+            turn = audio_frames + [silence] * int(GAP_SECONDS * 50)
+            started = loop.time()
+            sent = 0
+            for _ in range(turns):
+                for i, payload in enumerate(turn):
+                    # Paced against the start time, so send jitter never accumulates into drift
+                    await asyncio.sleep(max(0.0, started + sent * 0.02 - loop.time()))
+                    await ws.send(media(sent + 1, payload))
+                    sent += 1
+                    if i == len(audio_frames) - 1:
+                        result.speech_ends.append(loop.time())
+            await ws.send(json.dumps({"event": "stop", "streamSid": stream_sid}))
+            await asyncio.sleep(0.5)
+            receiver.cancel()
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    return result
+
+# --- 4. REPORT ---
+def pct(values: list, q: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def fmt_ms(value) -> str:
+    return "-" if value is None else f"{value * 1000:.0f} ms"
+
+def bucket_quantiles(metrics: str, name: str, qs=(0.5, 0.95, 0.99)) -> list:
+    buckets = [(float(le), float(n)) for le, n in re.findall(rf'{name}_bucket{{le="([^"]+)"}} (\S+)', metrics)]
+    total = buckets[-1][1] if buckets else 0
+    return [next((le for le, n in buckets if n >= q * total), None) if total else None for q in qs]
+
+async def run_load(calls: int = CALLS, turns: int = TURNS, workers: int = WORKERS, quiet: bool = False) -> dict:
+    """Start the fakes and the app, run the calls, stop everything; returns the measurements."""
+    audio_frames = frames(load_audio())
+    log_dir = tempfile.mkdtemp(prefix="load_test_")
+    fakes = [
+        spawn([os.path.join(HERE, "fake_gemini.py")], {"FAKE_GEMINI_PORT": str(GEMINI_PORT)}),
+        spawn([os.path.join(HERE, "fake_deepgram.py")], {"FAKE_DEEPGRAM_PORT": str(DEEPGRAM_PORT)}),
+    ]
+    env = {
+        "GEMINI_API_KEY": "fake",
+        "DEEPGRAM_API_KEY": "fake",
+        "GEMINI_BASE_URL": f"http://127.0.0.1:{GEMINI_PORT}",
+        "DEEPGRAM_STT_BASE_URL": f"ws://127.0.0.1:{DEEPGRAM_PORT}",
+        "DEEPGRAM_TTS_BASE_URL": f"http://127.0.0.1:{DEEPGRAM_PORT}",
+        "TTS_CACHE_MAX_BYTES": str(TTS_CACHE_MAX_BYTES),
+        "CALL_LOG_FILE": os.path.join(log_dir, "call_logs.jsonl"),
+        "STT_POOL_SIZE": str(max(2, min(calls, 20) // workers)),
+        "WEB_CONCURRENCY": str(workers),
+    }
+    if RECORDING:
+        env["RECORDING_DIR"] = os.path.join(log_dir, "recordings")
+        env["RECORDING_KEEP_RING"] = "1"
+        if not quiet:
+            print(f"Recording calls to {env['RECORDING_DIR']}")
+    if workers > 1:
+        fakes.append(spawn([os.path.join(HERE, "fake_redis.py")], {"FAKE_REDIS_PORT": str(REDIS_PORT)}))
+        env["SHARED_STORE_URL"] = f"redis://127.0.0.1:{REDIS_PORT}"
+    app = spawn(["-m", "uvicorn", "main:app", "--port", str(APP_PORT), "--log-level", "warning"], env)
+    try:
+        await wait_ready(f"http://127.0.0.1:{GEMINI_PORT}/stats")
+        await wait_ready(f"http://127.0.0.1:{DEEPGRAM_PORT}/stats")
+        await wait_ready(f"http://127.0.0.1:{APP_PORT}/")
+        await asyncio.sleep(2 + workers)  # let every worker's prewarm and STT pool settle
+        proc = ProcessStats(app.pid)
+        cpu_before, rss_before = proc.cpu_seconds(), proc.rss_mb()
+        peak_rss = rss_before
+        if not quiet:
+            print(f"{calls} calls x {turns} turns on {workers} worker(s), {len(audio_frames) * 0.02:.1f}s of "
+                  f"speech per turn; server RSS {rss_before:.0f} MB at rest")
+
+        started = time.monotonic()
+
+        async def staggered(n):
+            await asyncio.sleep(RAMP_SECONDS * n / calls)
+            return await run_call(n, audio_frames, turns)
+
+        running = asyncio.gather(*(staggered(n) for n in range(calls)))
+        while not running.done():
+            peak_rss = max(peak_rss, proc.rss_mb())
+            await asyncio.wait([running], timeout=0.5)
+        results = running.result()
+        elapsed = time.monotonic() - started
+        cpu = proc.cpu_seconds() - cpu_before
+        async with httpx.AsyncClient() as http:
+            metrics = (await http.get(f"http://127.0.0.1:{APP_PORT}/metrics")).text
+    finally:
+        for p in (app, *fakes):
+            p.terminate()
+        for p in (app, *fakes):
+            p.wait()
+
+    late = [t for r in results for t in r.lateness()]
+    return {
+        "calls": calls,
+        "workers": workers,
+        "failed": [r.error for r in results if r.error],
+        "ttfa": [t for r in results for t in r.first_audio() if t is not None],
+        "missing": sum(1 for r in results for t in r.first_audio() if t is None),
+        "late": late,
+        "stalls": sum(1 for t in late if t > 0.02),
+        "clears": sum(r.clears for r in results),
+        "server_ttfa": bucket_quantiles(metrics, "voice_time_to_first_audio_seconds"),
+        "elapsed": elapsed,
+        "cpu": cpu,
+        "rss_before": rss_before,
+        "peak_rss": peak_rss,
+    }
+
+def report(r: dict):
+    calls, ttfa, late, server = r["calls"], r["ttfa"], r["late"], r["server_ttfa"]
+    print(f"\n--- {calls - len(r['failed'])}/{calls} calls completed in {r['elapsed']:.1f}s ---")
+    for error in r["failed"][:5]:
+        print(f"  failed: {error}")
+    print(f"Time to first audio (caller stops talking, endpointing included): "
+          f"p50 {fmt_ms(pct(ttfa, 0.5))}  p95 {fmt_ms(pct(ttfa, 0.95))}  p99 {fmt_ms(pct(ttfa, 0.99))}  "
+          f"({len(ttfa)} turns, {r['missing']} without a reply)")
+    print(f"Time to first audio (server, final transcript, "
+          f"bucket bound): p50 {fmt_ms(server[0])}  p95 {fmt_ms(server[1])}  p99 {fmt_ms(server[2])}")
+    print(f"Frame jitter (playout lateness): p50 {fmt_ms(pct(late, 0.5))}  p95 {fmt_ms(pct(late, 0.95))}  "
+          f"p99 {fmt_ms(pct(late, 0.99))}  max {fmt_ms(max(late, default=None))}  "
+          f"({r['stalls']} of {len(late)} frames late by over 20 ms, {r['clears']} clears)")
+    print(f"Server CPU: {r['cpu']:.1f}s over {r['elapsed']:.1f}s = {100 * r['cpu'] / r['elapsed']:.0f}% of a core, "
+          f"{100 * r['cpu'] / r['elapsed'] / calls:.2f}% per call")
+    print(f"Server memory: peak {r['peak_rss']:.0f} MB, {(r['peak_rss'] - r['rss_before']) / calls:.2f} MB per call")
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:4]]
+    report(asyncio.run(run_load(*args)))
@@ -1,18 +1,16 @@
-import soundfile as sf
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from audio import SAMPLE_RATE, strip_wav_header, ulaw_decode, write_wav
 
 # 1. Read the raw mulaw file
 try:
-    data, samplerate = sf.read(
-        "ai_response.raw", 
-        channels=1, 
-        samplerate=8000, 
-        subtype='ULAW', 
-        format='RAW'
-    )
-    
+    with open("ai_response.raw", "rb") as f:
+        data = ulaw_decode(strip_wav_header(f.read()))
+
     # 2. Save it as a playable WAV
-    sf.write("final_result.wav", data, samplerate)
+    write_wav("final_result.wav", data, SAMPLE_RATE)
     print("Success! Open 'final_result.wav' to hear your AI.")
     
     # Optional: Play immediately (Windows only)
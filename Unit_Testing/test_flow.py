@@ -2,14 +2,16 @@ import asyncio
 import json
 import base64
 import os
-import librosa
-import soundfile as sf
+import sys
 import websockets
 import httpx
 from google import genai
 from google.genai import types
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from audio import SAMPLE_RATE, read_wav, resample, ulaw_encode
+
 load_dotenv()
 
 # --- CONFIGURATION ---
@@ -101,29 +103,16 @@ async def run_test():
     # A. PREPARE AUDIO (Convert wav to 8k mulaw on the fly)
     print(f"[Setup] Converting {INPUT_FILE} to 8000Hz Mulaw...")
     try:
-        y, sr = librosa.load(INPUT_FILE, sr=8000, mono=True)
-        # Convert float audio to 16-bit PCM then to Mulaw bytes would be complex manually.
-        # EASIER TRICK: We will send raw bytes, but we need to match what Deepgram expects.
-        # Since 'librosa' gives us float, let's use soundfile to write a temporary buffer 
-        # that matches the format, or just verify the file exists and let logic handle it.
-        
-        # Actually, for the TEST, let's just send the raw wav and remove 'encoding=mulaw' 
-        # from the URL strictly for the STT input part, BUT keep the output logic the same.
-        # This allows us to test the PIPELINE without complex audio conversion code here.
-        
-        with open(INPUT_FILE, "rb") as f:
-            audio_data = f.read()
-            
+        # Mono 16-bit PCM -> 8 kHz -> mulaw, exactly what Twilio streams in production
+        pcm, rate = read_wav(INPUT_FILE)
+        audio_data = ulaw_encode(resample(pcm, rate, SAMPLE_RATE))
     except FileNotFoundError:
         print("Error: Input file not found!")
         return
 
-    # B. CONNECT TO DEEPGRAM
-    # NOTE: We remove encoding=mulaw for the INPUT connection so it accepts your standard WAV file.
-    TEST_STT_URL = "wss://api.deepgram.com/v1/listen?model=nova-2&smart_formatting=true&interim_results=true&endpointing=500"
-    
+    # B. CONNECT TO DEEPGRAM (same encoding as the production stream)
     print(f"[Deepgram] Connecting...")
-    async with websockets.connect(TEST_STT_URL, additional_headers={"Authorization": f"Token {DEEPGRAM_API_KEY}"}) as dg_ws:
+    async with websockets.connect(DEEPGRAM_STT_URL, additional_headers={"Authorization": f"Token {DEEPGRAM_API_KEY}"}) as dg_ws:
         print("[Deepgram] Connected.")
         
         # Initialize Mock Twilio
@@ -132,7 +121,7 @@ async def run_test():
 
         # C. START BACKGROUND TASK: SEND AUDIO
         async def send_audio_file():
-            chunk_size = 4096
+            chunk_size = 800  # 100 ms of 8 kHz mulaw
             print(f"[User] Speaking (Streaming {len(audio_data)} bytes)...")
             for i in range(0, len(audio_data), chunk_size):
                 await dg_ws.send(audio_data[i:i+chunk_size])
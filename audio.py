@@ -0,0 +1,256 @@
+import wave
+from math import gcd
+
+import numpy as np
+
+# Twilio and Deepgram both speak 8 kHz mulaw, one byte per sample
+SAMPLE_RATE = 8000
+
+
+def _ulaw_decode_table() -> np.ndarray:
+    """G.711 mu-law byte -> 16-bit linear sample, for all 256 codes."""
+    u = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (u >> 4) & 0x07
+    mantissa = u & 0x0F
+    magnitude = (((mantissa << 3) + 0x84) << exponent) - 0x84
+    return np.where(u & 0x80, -magnitude, magnitude).astype(np.int16)
+
+
+def _ulaw_encode_table() -> np.ndarray:
+    """16-bit linear sample (indexed as uint16) -> G.711 mu-law byte, for all 65536 values."""
+    # Same 14-bit quantization as the reference G.711 code (and Python's audioop)
+    pcm = np.arange(65536, dtype=np.uint16).view(np.int16).astype(np.int32) >> 2
+    sign = np.where(pcm < 0, 0x80, 0x00)
+    magnitude = np.minimum(np.abs(pcm), 8158) + 0x21
+    exponent = np.floor(np.log2(magnitude)).astype(np.int32) - 5
+    mantissa = (magnitude >> (exponent + 1)) & 0x0F
+    return (~(sign | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8)
+
+
+ULAW_TO_LINEAR = _ulaw_decode_table()
+LINEAR_TO_ULAW = _ulaw_encode_table()
+
+
+def ulaw_decode(data) -> np.ndarray:
+    """mulaw bytes (bytes, bytearray, memoryview) -> int16 samples."""
+    return ULAW_TO_LINEAR[np.frombuffer(data, dtype=np.uint8)]
+
+
+def ulaw_encode(pcm: np.ndarray) -> bytes:
+    """int16 samples -> mulaw bytes."""
+    return LINEAR_TO_ULAW[np.asarray(pcm, dtype=np.int16).view(np.uint16)].tobytes()
+
+
+def to_int16(samples: np.ndarray) -> np.ndarray:
+    """Float samples in int16 scale -> int16, rounded and clipped."""
+    return np.clip(np.rint(samples), -32768, 32767).astype(np.int16)
+
+
+def iter_chunks(data, size: int):
+    """Zero-copy slices of `data` of `size` bytes (the last one may be shorter)."""
+    view = memoryview(data)
+    for i in range(0, len(view), size):
+        yield view[i : i + size]
+
+
+def decode_stream(ulaw_chunks):
+    for chunk in ulaw_chunks:
+        yield ulaw_decode(chunk)
+
+
+def encode_stream(pcm_chunks):
+    for pcm in pcm_chunks:
+        yield ulaw_encode(pcm)
+
+
+def read_wav(path: str) -> tuple:
+    """16-bit PCM WAV -> (mono int16 samples, sample rate). Channels are averaged."""
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM WAV is supported")
+        channels, rate = f.getnchannels(), f.getframerate()
+        pcm = np.frombuffer(f.readframes(f.getnframes()), dtype="<i2")
+    if channels > 1:
+        pcm = to_int16(pcm.reshape(-1, channels).mean(axis=1))
+    return pcm, rate
+
+
+def write_wav(path: str, pcm: np.ndarray, rate: int = SAMPLE_RATE):
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(np.asarray(pcm, dtype="<i2").tobytes())
+
+
+def strip_wav_header(data: bytes) -> bytes:
+    """Raw audio from a file that may start with a WAV header (as Deepgram's TTS output does)."""
+    if data[:4] == b"RIFF" and (i := data.find(b"data")) >= 0:
+        return data[i + 8 :]
+    return data
+
+
+# --------- RESAMPLING ---------
+
+def lowpass_filter(up: int, down: int, zero_crossings: int = 16, rolloff: float = 0.94,
+                   beta: float = 8.0) -> np.ndarray:
+    """Kaiser-windowed sinc for rational resampling by up/down, at the upsampled rate, with gain `up`."""
+    factor = max(up, down)
+    half = zero_crossings * factor
+    t = np.arange(-half, half + 1, dtype=np.float64)
+    cutoff = rolloff / factor
+    return (cutoff * np.sinc(cutoff * t) * np.kaiser(len(t), beta) * up).astype(np.float32)
+
+
+class Resampler:
+    """
+    Polyphase rational resampler for streams of int16 chunks.
+    Only the output samples that are kept are computed: each one is a dot product
+    of the last few input samples with one phase of the lowpass filter. Input
+    history is carried between chunks, so feeding a stream in 20 ms pieces gives
+    the same samples as resampling it in one go (delayed by `delay` samples).
+    """
+
+    def __init__(self, src_rate: int, dst_rate: int, zero_crossings: int = 16, block: int = 4096):
+        g = gcd(src_rate, dst_rate)
+        self.up = dst_rate // g
+        self.down = src_rate // g
+        self.block = block
+        h = lowpass_filter(self.up, self.down, zero_crossings)
+        self.taps = -(-len(h) // self.up)  # filter taps per phase
+        padded = np.zeros(self.taps * self.up, dtype=np.float32)
+        padded[: len(h)] = h
+        # phases[p, k] = h[p + k*up], reversed so it lines up with input in time order
+        self.phases = padded.reshape(self.taps, self.up).T[:, ::-1].copy()
+        self.delay = (len(h) - 1) // 2 // self.down  # output samples of filter latency
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        self._consumed = 0  # input samples seen before the current history window ends
+        self._n = 0  # next output sample index
+
+    def process(self, pcm: np.ndarray) -> np.ndarray:
+        x = np.concatenate([self._history, np.asarray(pcm, dtype=np.float32)])
+        total = self._consumed + len(pcm)
+        base = total - len(x)  # absolute input index of x[0]
+        # Output n needs input up to q = n*down // up; emit every n whose q is already here
+        end = -(-(total * self.up) // self.down)
+        out = np.empty(max(0, end - self._n), dtype=np.float32)
+        windows = np.lib.stride_tricks.sliding_window_view(x, self.taps)
+        for start in range(0, len(out), self.block):
+            n = np.arange(self._n + start, self._n + min(start + self.block, len(out)))
+            m = n * self.down
+            q = m // self.up
+            out[start : start + len(n)] = np.einsum(
+                "ij,ij->i", windows[q - base - self.taps + 1], self.phases[m % self.up]
+            )
+        self._n = end
+        self._consumed = total
+        self._history = x[len(x) - (self.taps - 1) :] if self.taps > 1 else x[:0]
+        return to_int16(out)
+
+    def flush(self) -> np.ndarray:
+        """Push the filter tail out by feeding silence."""
+        return self.process(np.zeros(self.taps, dtype=np.int16))
+
+
+def resample(pcm: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    """Resample a whole int16 signal, compensating the filter delay."""
+    if src_rate == dst_rate:
+        return np.asarray(pcm, dtype=np.int16)
+    r = Resampler(src_rate, dst_rate)
+    out = np.concatenate([r.process(pcm), r.flush()])
+    length = -(-len(pcm) * r.up // r.down)
+    return out[r.delay : r.delay + length]
+
+
+def resample_stream(pcm_chunks, src_rate: int, dst_rate: int):
+    """Resample an iterator of int16 chunks; output lags input by the filter delay."""
+    r = Resampler(src_rate, dst_rate)
+    for pcm in pcm_chunks:
+        out = r.process(pcm)
+        if len(out):
+            yield out
+    yield r.flush()
+
+
+# --------- LOUDNESS ---------
+
+FRAME_SAMPLES = 160  # 20 ms at 8 kHz
+
+
+def dbfs(pcm: np.ndarray) -> float:
+    """RMS level relative to int16 full scale."""
+    x = np.asarray(pcm, dtype=np.float32)
+    if not len(x):
+        return -120.0
+    return float(10 * np.log10(np.mean(x * x) / 32768.0**2 + 1e-12))
+
+
+def active_level(pcm: np.ndarray, gate_db: float = -50.0) -> float | None:
+    """Level of the 20 ms frames above `gate_db`, so pauses don't pull the average down."""
+    n = len(pcm) // FRAME_SAMPLES
+    if not n:
+        return None
+    frames = np.asarray(pcm[: n * FRAME_SAMPLES], dtype=np.float32).reshape(n, FRAME_SAMPLES)
+    power = np.mean(frames * frames, axis=1) / 32768.0**2
+    active = power[power > 10 ** (gate_db / 10)]
+    if not len(active):
+        return None
+    return float(10 * np.log10(np.mean(active)))
+
+
+def apply_gain(pcm: np.ndarray, gain_db: float, ceiling_dbfs: float = -1.0) -> np.ndarray:
+    """Scale by `gain_db`, reduced if needed so peaks stay under `ceiling_dbfs`."""
+    x = np.asarray(pcm, dtype=np.float32)
+    gain = 10 ** (gain_db / 20)
+    peak = float(np.max(np.abs(x))) if len(x) else 0.0
+    ceiling = 32767 * 10 ** (ceiling_dbfs / 20)
+    if gain > 1 and peak * gain > ceiling:
+        # Boost only as far as the peaks allow, never below unity
+        gain = max(1.0, ceiling / peak)
+    return to_int16(x * gain)
+
+
+def normalize_loudness(pcm: np.ndarray, target_dbfs: float = -20.0, max_gain_db: float = 12.0) -> np.ndarray:
+    level = active_level(pcm)
+    if level is None:
+        return np.asarray(pcm, dtype=np.int16)
+    gain = float(np.clip(target_dbfs - level, -max_gain_db, max_gain_db))
+    return apply_gain(pcm, gain)
+
+
+def normalize_ulaw(audio, target_dbfs: float = -20.0, max_gain_db: float = 12.0) -> bytes:
+    return ulaw_encode(normalize_loudness(ulaw_decode(audio), target_dbfs, max_gain_db))
+
+
+class LoudnessNormalizer:
+    """
+    Streaming loudness normalization of mulaw chunks, for audio that is played
+    while it is still arriving. The gain follows the active level measured so far
+    and moves at most `max_step_db` per chunk, so it settles within the first
+    words instead of pumping.
+    """
+
+    def __init__(self, target_dbfs: float = -20.0, max_gain_db: float = 12.0, max_step_db: float = 3.0):
+        self.target_dbfs = target_dbfs
+        self.max_gain_db = max_gain_db
+        self.max_step_db = max_step_db
+        self.gain_db = 0.0
+        self._energy = 0.0  # sum of active frame power
+        self._frames = 0
+
+    def process(self, audio) -> bytes:
+        pcm = ulaw_decode(audio)
+        n = len(pcm) // FRAME_SAMPLES
+        if n:
+            frames = pcm[: n * FRAME_SAMPLES].astype(np.float32).reshape(n, FRAME_SAMPLES)
+            power = np.mean(frames * frames, axis=1) / 32768.0**2
+            active = power[power > 1e-5]  # -50 dBFS gate
+            self._energy += float(np.sum(active))
+            self._frames += len(active)
+        if self._frames:
+            level = 10 * np.log10(self._energy / self._frames)
+            wanted = float(np.clip(self.target_dbfs - level, -self.max_gain_db, self.max_gain_db))
+            self.gain_db += float(np.clip(wanted - self.gain_db, -self.max_step_db, self.max_step_db))
+        if abs(self.gain_db) < 0.1:
+            return bytes(audio)
+        return ulaw_encode(apply_gain(pcm, self.gain_db))
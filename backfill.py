@@ -0,0 +1,264 @@
+"""
+Backfill incident records and call-quality metrics from historical conversation logs.
+
+    python backfill.py call_logs.jsonl --out incidents.jsonl
+    python backfill.py conversation_logs.txt logs/*.jsonl --out incidents.parquet --concurrency 8 --rate 5 --verify
+
+Both log formats are read: the server's JSONL call log (records grouped by
+streamSid) and the older text log split by "NEW CALL STARTED AT" banners.
+Logs are read line by line, one call at a time, so file size does not matter.
+Finished call ids are appended to a checkpoint file (<out>.done); a rerun skips
+them and appends only the rest. Set GEMINI_BASE_URL to run against a local fake
+server (Unit_Testing/fake_gemini.py) instead of Gemini.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from llm import is_retryable
+from scheduler import Scheduler, Priority
+from pipeline.agents import agents, make_client
+
+BANNER = re.compile(r"^NEW CALL STARTED AT (.+?)\s*$")
+SEPARATOR = re.compile(r"^-{10,}\s*$")
+TURN = re.compile(r"^\[(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)\] (User|AI): ?(.*)$")
+# Assistant lines that mean the turn went wrong (fallbacks, misheard the caller)
+FALLBACK = re.compile(r"trouble processing|can't (quite )?understand|cannot understand|didn't catch", re.I)
+MARKDOWN = re.compile(r"\*\*|^\s*\d+\.\s|^\s*\*\s", re.M)
+
+
+class CallTranscript:
+    def __init__(self, call_id: str, started_at: str):
+        self.call_id = call_id
+        self.started_at = started_at
+        self.turns = []  # [(timestamp, "User" | "AI", text)]
+        self.reply_seconds = []  # measured by the server (JSONL logs); else derived from timestamps
+
+    def text(self) -> str:
+        return "\n".join(f"{role}: {text}" for _, role, text in self.turns)
+
+
+def iter_calls(path: str):
+    """Yield the calls in a log of either format, reading the file lazily."""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        first = next((line for line in f if line.strip()), "")
+    if first.lstrip().startswith("{"):
+        return iter_jsonl_calls(path)
+    return iter_text_calls(path)
+
+
+def iter_jsonl_calls(path: str):
+    """
+    Yield one CallTranscript per streamSid of a JSONL call log (call_log.py). Records
+    of concurrent calls interleave, so each call is held until its stop record.
+    """
+    calls = {}
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by a crash
+            sid = record.get("streamSid")
+            if not sid:
+                continue
+            call = calls.get(sid)
+            if call is None:
+                call = calls[sid] = CallTranscript(sid, record.get("ts", ""))
+            role = record.get("role")
+            if role == "user" and record.get("text"):
+                call.turns.append((record["ts"], "User", record["text"]))
+            elif role == "assistant" and record.get("text") and record.get("event") != "not_played":
+                # Logged once the reply has finished, so its own timestamp says little about latency
+                call.turns.append((record["ts"], "AI", record["text"]))
+                if record.get("first_audio_ms") is not None:
+                    call.reply_seconds.append(record["first_audio_ms"] / 1000)
+            elif role == "call" and record.get("event") == "stop":
+                del calls[sid]
+                if call.turns:
+                    yield call
+    # Calls with no stop record (server killed mid-call)
+    for call in calls.values():
+        if call.turns:
+            yield call
+
+
+def iter_text_calls(path: str):
+    """Yield one CallTranscript per "NEW CALL STARTED AT" banner of the old text log."""
+    source = os.path.basename(path)
+    seen = {}
+    call = None
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if m := BANNER.match(line):
+                if call and call.turns:
+                    yield call
+                started = m.group(1)
+                n = seen[started] = seen.get(started, 0) + 1
+                call = CallTranscript(f"{source}:{started}" + (f"#{n}" if n > 1 else ""), started)
+            elif call is None or SEPARATOR.match(line):
+                continue
+            elif m := TURN.match(line):
+                call.turns.append((m.group(1), m.group(2), m.group(3).strip()))
+            elif line.strip() and call.turns:
+                # Multi-line assistant reply (lists etc.)
+                ts, role, text = call.turns[-1]
+                call.turns[-1] = (ts, role, f"{text}\n{line.strip()}")
+    if call and call.turns:
+        yield call
+
+
+def _ts(value: str) -> datetime | None:
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def quality(call: CallTranscript) -> dict:
+    """Turn-level quality numbers computable from the log alone."""
+    replies = []
+    previous_user = None
+    for ts, role, _ in call.turns:
+        if role == "User":
+            previous_user = _ts(ts)
+        elif previous_user is not None and (t := _ts(ts)) is not None:
+            replies.append((t - previous_user).total_seconds())
+            previous_user = None
+    replies = call.reply_seconds or replies
+    ai = [text for _, role, text in call.turns if role == "AI"]
+    start, end = _ts(call.started_at), _ts(call.turns[-1][0])
+    return {
+        "duration_s": round((end - start).total_seconds(), 1) if start and end else None,
+        "user_turns": sum(1 for _, role, _ in call.turns if role == "User"),
+        "ai_turns": len(ai),
+        "reply_median_s": statistics.median(replies) if replies else None,
+        "reply_max_s": max(replies) if replies else None,
+        "fallback_replies": sum(1 for text in ai if FALLBACK.search(text)),
+        "markdown_replies": sum(1 for text in ai if MARKDOWN.search(text)),
+    }
+
+
+async def with_retries(make_call, attempts: int = 4, backoff: float = 0.5):
+    for attempt in range(attempts):
+        try:
+            return await make_call()
+        except Exception as e:
+            if attempt == attempts - 1 or not is_retryable(e):
+                raise
+            await asyncio.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+async def process(call: CallTranscript, agent: agents, verify: bool) -> dict:
+    transcript = call.text()
+    row = {"call_id": call.call_id, "started_at": call.started_at, "quality": quality(call)}
+    row["incident"] = await with_retries(lambda: agent.extractor_node_async(transcript))
+    if verify:
+        ready, question = await with_retries(lambda: agent.verifier_agent_async(row["incident"], transcript))
+        row["ready_to_dispatch"] = ready
+        row["follow_up_question"] = question
+    return row
+
+
+def load_checkpoint(path: str) -> set:
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+def write_parquet(rows_path: str, out_path: str):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print(f"pyarrow is not installed; results left in {rows_path}")
+        return
+    with open(rows_path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    pq.write_table(pa.Table.from_pylist(rows), out_path)
+    print(f"Wrote {len(rows)} rows to {out_path}")
+
+
+async def run(args) -> int:
+    client = make_client(os.getenv("GEMINI_API_KEY"))
+    # Every Gemini request (extract, verify, repair) takes a rate token and a concurrency slot
+    limiter = Scheduler("gemini", args.rate, max(1.0, args.rate), args.concurrency, max_queue=10_000, max_wait=3600)
+    agent = agents(client, admission=lambda: limiter.slot(Priority.BACKGROUND))
+
+    parquet = args.out.endswith(".parquet")
+    rows_path = f"{args.out}.partial.jsonl" if parquet else args.out
+    checkpoint_path = args.checkpoint or f"{args.out}.done"
+    done = load_checkpoint(checkpoint_path)
+    queue = asyncio.Queue(maxsize=args.concurrency * 2)
+    counts = {"done": 0, "skipped": 0, "failed": 0}
+    started = time.monotonic()
+
+    with open(rows_path, "a", encoding="utf-8") as rows, open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+        async def produce():
+            for path in args.logs:
+                for call in iter_calls(path):
+                    if call.call_id in done:
+                        counts["skipped"] += 1
+                        continue
+                    await queue.put(call)
+            for _ in range(args.concurrency):
+                await queue.put(None)
+
+        async def work():
+            while (call := await queue.get()) is not None:
+                try:
+                    row = await process(call, agent, args.verify)
+                except Exception as e:
+                    counts["failed"] += 1
+                    print(f"{call.call_id}: {type(e).__name__}: {e}", file=sys.stderr)
+                    continue  # not checkpointed, so the next run tries it again
+                # Result first, then checkpoint: a crash in between repeats a call, never loses one
+                rows.write(json.dumps(row) + "\n")
+                rows.flush()
+                checkpoint.write(call.call_id + "\n")
+                checkpoint.flush()
+                counts["done"] += 1
+                if counts["done"] % args.progress_every == 0:
+                    print(f"{counts['done']} calls in {time.monotonic() - started:.1f}s")
+
+        await asyncio.gather(produce(), *(work() for _ in range(args.concurrency)))
+
+    elapsed = time.monotonic() - started
+    stats = agent.stats
+    print(
+        f"Processed {counts['done']} calls ({counts['skipped']} already done, {counts['failed']} failed) "
+        f"in {elapsed:.1f}s; {stats['requests']} Gemini requests, {stats['prompt_tokens']} prompt + "
+        f"{stats['output_tokens']} output tokens, {stats['parse_failures']} parse failures "
+        f"({stats['repair_failures']} after repair)"
+    )
+    if parquet and not counts["failed"]:
+        write_parquet(rows_path, args.out)
+    return 1 if counts["failed"] else 0
+
+
+def main(argv=None) -> int:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Backfill incident records from conversation logs.")
+    parser.add_argument("logs", nargs="+", help="JSONL call logs, or text logs split by 'NEW CALL STARTED AT' banners")
+    parser.add_argument("--out", default="incidents.jsonl", help=".jsonl, or .parquet (needs pyarrow)")
+    parser.add_argument("--checkpoint", help="finished call ids (default: <out>.done)")
+    parser.add_argument("--concurrency", type=int, default=4, help="calls and Gemini requests in flight")
+    parser.add_argument("--rate", type=float, default=5.0, help="Gemini requests per second")
+    parser.add_argument("--verify", action="store_true", help="also run the verifier on each record")
+    parser.add_argument("--progress-every", type=int, default=50)
+    return asyncio.run(run(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
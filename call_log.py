@@ -0,0 +1,86 @@
+import json
+import time
+import asyncio
+from datetime import datetime
+
+
+class CallLogWriter:
+    """
+    Structured JSONL call log that never blocks the media path.
+    Records go into a bounded queue; one background task batches them and
+    appends to disk off the event loop. When the queue is full the record is
+    dropped and counted instead of making the caller wait.
+    """
+
+    def __init__(self, path: str, max_queue: int = 10_000, batch_size: int = 256,
+                 flush_interval: float = 0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._task = None
+        self._closing = False
+        self.written = 0
+        self.dropped = 0
+
+    def start(self):
+        if self._task is None:
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def log(self, stream_sid: str | None, role: str, text: str | None = None, **fields):
+        record = {
+            "ts": datetime.now().isoformat(timespec="milliseconds"),
+            "mono": round(time.monotonic(), 4),
+            "streamSid": stream_sid,
+            "role": role,
+        }
+        if text is not None:
+            record["text"] = text
+        record.update(fields)
+        try:
+            self._queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _run(self):
+        while not (self._closing and self._queue.empty()):
+            batch = [await self._queue.get()]
+            # Give the batch a moment to fill up so disk writes stay few and large
+            if not self._closing and self._queue.qsize() < self.batch_size:
+                await asyncio.sleep(self.flush_interval)
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            batch = [r for r in batch if r is not None]
+            if batch:
+                await self._flush(batch)
+
+    async def _flush(self, batch):
+        lines = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in batch)
+        try:
+            await asyncio.to_thread(self._append, lines)
+            self.written += len(batch)
+        except OSError as e:
+            self.dropped += len(batch)
+            print(f"Call log write failed: {e}")
+
+    def _append(self, lines: str):
+        # One unbuffered O_APPEND write per batch, so worker processes sharing the file never interleave lines
+        with open(self.path, "ab", buffering=0) as f:
+            f.write(lines.encode("utf-8"))
+
+    async def aclose(self):
+        """Stop the writer once everything still queued has been flushed."""
+        self._closing = True
+        if self._task is None:
+            return
+        try:
+            self._queue.put_nowait(None)  # wake the writer if it is idle
+        except asyncio.QueueFull:
+            pass  # a full queue means the writer is busy and will see _closing
+        await self._task
+        self._task = None
@@ -0,0 +1,65 @@
+import json
+import asyncio
+import binascii
+
+from tts import FRAME_BYTES
+
+FRAME_SECONDS = 0.02  # 160 bytes of 8 kHz mulaw
+
+
+class MediaFramer:
+    """
+    Outbound Twilio media for one call.
+    The JSON envelope is built once per streamSid, so a frame costs one base64
+    call over a memoryview slice plus a string concat. Frames are released paced
+    to the real-time clock with a small lead, so Twilio never holds more than
+    `lead` seconds of audio and a barge-in "clear" cuts playback almost at once.
+    """
+
+    def __init__(self, send_text, stream_sid: str, lead: float = 0.1, tap=None):
+        self.send_text = send_text
+        self.stream_sid = stream_sid
+        self.lead = lead
+        self.tap = tap  # called with (audio, when it starts playing) for every buffer sent, e.g. a recorder
+        # '{"event": "media", "streamSid": "...", "media": {"payload": "' + payload + '"}}'
+        envelope = json.dumps({"event": "media", "streamSid": stream_sid, "media": {"payload": "\0"}})
+        self._prefix, self._suffix = envelope.split("\\u0000")
+        self._clock = None  # when the next frame starts playing at the caller
+        self.frames_sent = 0
+
+    def encode(self, audio) -> list:
+        """Encode a buffer of mulaw audio into ready-to-send media messages, one per 20 ms frame."""
+        view = memoryview(audio)
+        prefix, suffix, b64 = self._prefix, self._suffix, binascii.b2a_base64
+        return [
+            prefix + b64(view[i : i + FRAME_BYTES], newline=False).decode("ascii") + suffix
+            for i in range(0, len(view), FRAME_BYTES)
+        ]
+
+    async def send(self, audio):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if self._clock is None or self._clock < now:
+            # Twilio's buffer has drained since the last send: playback restarts now
+            self._clock = now
+        if self.tap:
+            self.tap(audio, self._clock)
+        for message in self.encode(audio):
+            ahead = self._clock - loop.time()
+            if ahead > self.lead:
+                # Sleep down to half the lead, then burst, so we wake ~every lead/2 rather than every frame
+                await asyncio.sleep(ahead - self.lead / 2)
+            await self.send_text(message)
+            self._clock += FRAME_SECONDS
+            self.frames_sent += 1
+
+    def reset(self):
+        """Forget the playout clock, e.g. after Twilio was told to clear its buffer."""
+        self._clock = None
+
+    @property
+    def buffered(self) -> float:
+        """Seconds of audio sent but not yet played, by our clock."""
+        if self._clock is None:
+            return 0.0
+        return max(0.0, self._clock - asyncio.get_running_loop().time())
@@ -0,0 +1,68 @@
+import binascii
+
+# Twilio serializes media events compactly with "event" first:
+# {"event":"media","sequenceNumber":"4","media":{"track":"inbound",...,"payload":"..."},"streamSid":"MZ..."}
+MEDIA_PREFIX = '{"event":"media"'
+PAYLOAD_KEY = '"payload":"'
+
+BYTES_PER_MS = 8  # 8 kHz mulaw, 1 byte per sample
+
+
+def media_payload(msg: str) -> str | None:
+    """
+    Base64 payload of a Twilio media event, found without building a dict.
+    Returns None for anything else (start/stop/mark, or an unexpected layout),
+    which then goes through json.loads as before.
+    """
+    if not msg.startswith(MEDIA_PREFIX):
+        return None
+    start = msg.find(PAYLOAD_KEY)
+    if start < 0:
+        return None
+    start += len(PAYLOAD_KEY)
+    end = msg.find('"', start)
+    if end < 0:
+        return None
+    return msg[start:end]
+
+
+class InboundBatcher:
+    """
+    Coalesces 20 ms Twilio frames into larger batches before they go to Deepgram,
+    decoding each payload straight into one reusable buffer. Fewer, larger
+    websocket sends cut per-frame overhead at the cost of `batch_ms` of STT delay.
+    """
+
+    def __init__(self, send, batch_ms: int = 60):
+        self.send = send
+        self.batch_bytes = batch_ms * BYTES_PER_MS
+        self._buf = bytearray(self.batch_bytes + 4096)
+        self._view = memoryview(self._buf)
+        self._n = 0
+        self.frames = 0
+        self.batches = 0
+
+    async def add(self, payload: str):
+        audio = binascii.a2b_base64(payload)
+        self.frames += 1
+        end = self._n + len(audio)
+        if end > len(self._buf):
+            await self.flush()
+            if len(audio) > len(self._buf):
+                self.batches += 1
+                await self.send(audio)
+                return
+            end = len(audio)
+        self._view[self._n : end] = audio
+        self._n = end
+        if self._n >= self.batch_bytes:
+            await self.flush()
+
+    async def flush(self):
+        if not self._n:
+            return
+        # One copy per batch: the websocket may hold on to what it was given
+        data = bytes(self._view[: self._n])
+        self._n = 0
+        self.batches += 1
+        await self.send(data)
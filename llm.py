@@ -0,0 +1,197 @@
+import re
+import time
+import random
+import asyncio
+from collections import deque
+
+import httpx
+from google.genai import errors
+
+from scheduler import Priority
+
+# HTTP statuses worth another attempt: overload, rate limiting, transient server faults
+RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class LLMTimeout(Exception):
+    """No reply text arrived before the turn's deadline."""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, errors.APIError):
+        return exc.code in RETRYABLE_CODES
+    return isinstance(exc, (httpx.TransportError, ConnectionError, TimeoutError))
+
+
+# Canned replies for when Gemini is too slow or down. Each is one sentence so it
+# matches a prewarmed TTS cache entry exactly and plays without a TTS round trip.
+FALLBACK_DEFAULT = "Stay on the line, help is being arranged."
+FALLBACK_LOCATION = "Please stay on the line and tell me your exact location."
+FALLBACK_REPLIES = [
+    (re.compile(r"\b(not breathing|unconscious|unresponsive|collapsed|cpr|heart)\b"),
+     "Keep pushing hard and fast in the centre of the chest, help is on the way."),
+    (re.compile(r"\b(bleed|bleeding|blood|cut|stabbed|wound)"),
+     "Keep pressing firmly on the wound, help is on the way."),
+    (re.compile(r"\b(fire|smoke|burning|gas)\b"),
+     "Get everyone out and stay out of the building, help is on the way."),
+    (re.compile(r"\b(chok\w*)\b"),
+     "Give five firm back blows between the shoulder blades, help is on the way."),
+]
+FALLBACK_PROMPTS = [FALLBACK_DEFAULT, FALLBACK_LOCATION] + [reply for _, reply in FALLBACK_REPLIES]
+
+
+def fallback_reply(caller_text: str, first_turn: bool = False) -> str:
+    """Pick the canned reply that fits what the caller has said so far."""
+    text = caller_text.lower()
+    for pattern, reply in FALLBACK_REPLIES:
+        if pattern.search(text):
+            return reply
+    return FALLBACK_LOCATION if first_turn else FALLBACK_DEFAULT
+
+
+class HedgedLLM:
+    """
+    Latency-bounded Gemini streaming.
+    If the first token has not arrived after the hedge delay (a quantile of the
+    first-token latency of the last `window` requests, timed from when each was
+    sent so queueing is left out, clamped), a second identical request is fired;
+    whichever produces text first wins and the other is cancelled. Retryable failures are
+    retried with jittered exponential backoff. If no text arrives within
+    `deadline` seconds, LLMTimeout is raised so the caller can play a canned reply.
+    Every request (hedges and retries too) goes through `limiter`, a Scheduler,
+    and hedges are only sent while it has spare capacity.
+    """
+
+    def __init__(self, client, model: str, config, limiter=None, deadline: float = 3.0,
+                 stall_timeout: float = 3.0, hedge_quantile: float = 0.95, hedge_min: float = 0.3,
+                 hedge_max: float = 1.5, retries: int = 2, backoff: float = 0.2, window: int = 200):
+        self.client = client
+        self.model = model
+        self.config = config  # async () -> GenerateContentConfig, expected not to wait on I/O
+        self._recent = deque(maxlen=window)  # first-token latency of the latest requests
+        self.limiter = limiter
+        self.deadline = deadline
+        self.stall_timeout = stall_timeout
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min = hedge_min
+        self.hedge_max = hedge_max
+        self.retries = retries
+        self.backoff = backoff
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.retried = 0
+        self.timeouts = 0
+
+    def hedge_delay(self) -> float:
+        if len(self._recent) < 5:
+            return self.hedge_max
+        ordered = sorted(self._recent)
+        observed = ordered[min(len(ordered) - 1, int(self.hedge_quantile * len(ordered)))]
+        return min(self.hedge_max, max(self.hedge_min, observed))
+
+    async def _attempt(self, n: int, contents, config, events: asyncio.Queue, priority: Priority):
+        try:
+            if self.limiter:
+                await self.limiter.acquire(priority)
+            try:
+                sent = time.monotonic()
+                stream = await self.client.aio.models.generate_content_stream(
+                    model=self.model, contents=contents, config=config,
+                )
+                async for chunk in stream:
+                    if chunk.text and sent is not None:
+                        self._recent.append(time.monotonic() - sent)
+                        sent = None
+                    if chunk.text or chunk.usage_metadata:
+                        events.put_nowait((n, "chunk", chunk))
+                events.put_nowait((n, "done", None))
+            finally:
+                if self.limiter:
+                    self.limiter.release()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            events.put_nowait((n, "error", e))
+
+    async def stream(self, contents, hedge: bool = True, priority: Priority = Priority.NORMAL):
+        """Yield Gemini response chunks (with .text and .usage_metadata) from the winning request."""
+        loop = asyncio.get_running_loop()
+        # The clock starts before anything is awaited, so resolving the config counts against the deadline
+        started = loop.time()
+        deadline = started + self.deadline
+        try:
+            config = await asyncio.wait_for(self.config(), self.deadline)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise LLMTimeout(f"no LLM config after {loop.time() - started:.1f}s")
+        events = asyncio.Queue()
+        attempts = []
+        hedged = set()
+
+        def launch():
+            self.requests += 1
+            attempts.append(asyncio.create_task(self._attempt(len(attempts), contents, config, events, priority)))
+            return len(attempts) - 1
+
+        hedge_at = started + self.hedge_delay() if hedge else None
+        retry_at = None
+        retries_left = self.retries
+        failures = 0
+        winner = None
+        launch()
+        try:
+            while True:
+                now = loop.time()
+                if winner is None:
+                    wake = min(t for t in (deadline, hedge_at, retry_at) if t is not None)
+                else:
+                    wake = now + self.stall_timeout
+                try:
+                    n, kind, payload = await asyncio.wait_for(events.get(), max(0.0, wake - now))
+                except asyncio.TimeoutError:
+                    now = loop.time()
+                    if winner is not None or now >= deadline:
+                        self.timeouts += 1
+                        raise LLMTimeout(f"no LLM output for {now - started:.1f}s")
+                    if hedge_at is not None and now >= hedge_at:
+                        hedge_at = None
+                        # Under load a hedge would only take capacity from another caller
+                        if self.limiter is None or self.limiter.idle:
+                            self.hedges += 1
+                            hedged.add(launch())
+                    if retry_at is not None and now >= retry_at:
+                        retry_at = None
+                        launch()
+                    continue
+
+                if winner is not None and n != winner:
+                    continue
+                if kind == "chunk":
+                    if winner is None:
+                        winner = n
+                        if n in hedged:
+                            self.hedge_wins += 1
+                        for i, task in enumerate(attempts):
+                            if i != n:
+                                task.cancel()
+                    yield payload
+                elif kind == "done":
+                    if winner is None and any(not t.done() for i, t in enumerate(attempts) if i != n):
+                        continue  # an empty reply; let the other request answer
+                    return
+                else:  # error
+                    if winner is not None:
+                        raise payload
+                    failures += 1
+                    live = any(not t.done() for i, t in enumerate(attempts) if i != n)
+                    if retries_left and is_retryable(payload) and retry_at is None:
+                        retries_left -= 1
+                        self.retried += 1
+                        delay = self.backoff * 2 ** (failures - 1) * random.uniform(0.5, 1.5)
+                        retry_at = min(loop.time() + delay, deadline)
+                    elif not live and retry_at is None:
+                        raise payload
+        finally:
+            for task in attempts:
+                task.cancel()
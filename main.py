@@ -1,26 +1,49 @@
 import os
 import json
-import base64
 import asyncio
 import websockets
 import re
-from datetime import datetime
-from websockets.asyncio.client import connect
+import time
+import tempfile
+from contextlib import asynccontextmanager, aclosing
 from fastapi import FastAPI, WebSocket, Request
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, PlainTextResponse
 from fastapi.websockets import WebSocketDisconnect
 from twilio.twiml.voice_response import VoiceResponse, Connect, Stream
 from dotenv import load_dotenv
-import httpx
 from google import genai
 from google.genai import types
+from tts import TTSClient, FRAME_BYTES
+from audio import iter_chunks
+from tts_cache import TTSCache
+from call_log import CallLogWriter
+from metrics import Registry, WorkerMetrics, CallTrace, TurnTrace
+from framer import MediaFramer
+from inbound import InboundBatcher, media_payload
+from vad import SilenceGate
+from session import SessionStore, CallSession, PromptCache, estimate_tokens
+from utterance import UtteranceAssembler, FILLER_WORDS
+from stt_pool import STTPool
+from speculation import Speculator, SpeculativeReply
+from prompts import SYSTEM_MESSAGE, EMERGENCY_GUIDANCE, LLM_MODEL, LLM_GENERATION
+from llm import HedgedLLM, LLMTimeout, FALLBACK_PROMPTS, fallback_reply
+from scheduler import Scheduler, Priority, Overloaded
+from store import open_store, StoreWriter
+from recorder import CallRecorder, finalize
+from pipeline.agents import agents, IncidentTracker
 
 load_dotenv()
 
 # --- CONFIGURATION ---
 llm_key = os.getenv("GEMINI_API_KEY")
 deepgram_key = os.getenv("DEEPGRAM_API_KEY")
-SERVER_DOMAIN = "1a05c5954e2d.ngrok-free.app"
+# Public host Twilio dials for the media stream; unset, the host /incoming_call was reached on
+SERVER_DOMAIN = os.getenv("SERVER_DOMAIN")
+# Worker processes behind the one port. uvicorn reads it as its --workers default; set this
+# rather than passing --workers, so each worker knows its share of the provider limits
+WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", 1)))
+# Shared state for all workers: memory:// (one worker only) or redis://host:port/db
+SHARED_STORE_URL = os.getenv("SHARED_STORE_URL", "memory://")
 
 if not llm_key:
     raise ValueError("Missing GEMINI_API_KEY.")
@@ -28,47 +51,286 @@ if not deepgram_key:
     raise ValueError("Missing DEEPGRAM_API_KEY.")
 
 # --------- LOGGING SETUP ---------
-LOG_FILE = "conversation_logs.txt"
+# One JSON record per line, written by a background task so disk I/O never stalls audio
+LOG_FILE = os.getenv("CALL_LOG_FILE", "call_logs.jsonl")
+call_log = CallLogWriter(LOG_FILE)
 
-def log_to_file(role: str, text: str):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(f"[{timestamp}] {role}: {text}\n")
-
-def log_start_call():
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(f"\n{'-'*30}\nNEW CALL STARTED AT {datetime.now()}\n{'-'*30}\n")
+# --------- SHARED STATE ---------
+# Everything below is created once per worker process. A call's media stream and its
+# Deepgram socket stay on the worker that accepted it; what other workers need to see
+# (call metadata, incident records) and what is worth sharing (TTS audio, the Gemini
+# context cache) goes through the shared store.
+store = open_store(SHARED_STORE_URL)
+store_writer = StoreWriter(store)
+SHARED_TTL = int(os.getenv("SHARED_STORE_TTL", 3600))
+if WORKERS > 1 and not store.remote:
+    print(f"Warning: {WORKERS} workers with {SHARED_STORE_URL}; calls and caches are not shared between them")
 
 # --------- LLM CONFIG ---------
-client = genai.Client(api_key=llm_key)
-
-SYSTEM_MESSAGE = (
-    "You are an emergency helpline AI. "
-    "You listen to the caller's words (transcriptions) and respond briefly, "
-    "calmly and clearly with life-saving guidance. "
-    "Avoid jokes, keep instructions step-by-step and simple. "
-    "Do not use Markdown formatting (like **bold** or *italics*). "
-    "Respond in plain text only."
+# GEMINI_BASE_URL points the client elsewhere, e.g. Unit_Testing/fake_gemini.py for load tests
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")
+client = genai.Client(
+    api_key=llm_key,
+    http_options=types.HttpOptions(base_url=GEMINI_BASE_URL) if GEMINI_BASE_URL else None,
+)
+
+# The system prompt and guidance go inline with every turn. PROMPT_CACHE=1 serves them from a
+# Gemini context cache instead, for prompts of at least PROMPT_CACHE_MIN_TOKENS (model dependent);
+# the shipped prompt is well below that, so it stays off by default
+PROMPT_CACHE = os.getenv("PROMPT_CACHE", "0") == "1"
+PROMPT_CACHE_MIN_TOKENS = int(os.getenv("PROMPT_CACHE_MIN_TOKENS", 4096))
+prompt_cache = PromptCache(client, LLM_MODEL, SYSTEM_MESSAGE, EMERGENCY_GUIDANCE,
+                           store=store if store.remote else None, min_tokens=PROMPT_CACHE_MIN_TOKENS,
+                           enabled=PROMPT_CACHE)
+# A turn gets LLM_DEADLINE_MS for its first token before a canned reply is played instead.
+# A duplicate request is sent once the first token is later than the LLM_HEDGE_QUANTILE of the
+# last 200 requests' first-token latency, queue wait excluded (clamped to LLM_HEDGE_MIN_MS..LLM_HEDGE_MAX_MS).
+LLM_DEADLINE_MS = int(os.getenv("LLM_DEADLINE_MS", 3000))
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", 0.95))
+LLM_HEDGE_MIN_MS = int(os.getenv("LLM_HEDGE_MIN_MS", 300))
+LLM_HEDGE_MAX_MS = int(os.getenv("LLM_HEDGE_MAX_MS", 1500))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", 2))
+# Gemini admission control: requests/second (bursting to twice that), concurrent streams and
+# queue length. Critical calls and first turns are served first when queued. Rate and
+# concurrency are for the whole server; each worker enforces its 1/WORKERS share.
+LLM_RATE = float(os.getenv("LLM_RATE", 25)) / WORKERS
+LLM_MAX_CONCURRENT = max(1, int(os.getenv("LLM_MAX_CONCURRENT", 64)) // WORKERS)
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", 256))
+
+# --------- CALL SESSIONS ---------
+sessions = SessionStore(
+    idle_timeout=float(os.getenv("SESSION_IDLE_TIMEOUT", 600)),
+    max_history_tokens=int(os.getenv("SESSION_HISTORY_TOKENS", 1200)),
+    shared=store_writer,
+    shared_ttl=SHARED_TTL,
 )
 
 # --------- DEEPGRAM CONFIG ---------
 # endpointing=1000 means wait 1 second of silence before finalizing (prevents cutting off user)
+# utterance_end_ms sends UtteranceEnd after that much silence, even when noise keeps endpointing from firing
+# DEEPGRAM_STT_BASE_URL / DEEPGRAM_TTS_BASE_URL swap the host, e.g. for Unit_Testing/fake_deepgram.py
+DEEPGRAM_STT_BASE_URL = os.getenv("DEEPGRAM_STT_BASE_URL", "wss://api.deepgram.com").rstrip("/")
+DEEPGRAM_TTS_BASE_URL = os.getenv("DEEPGRAM_TTS_BASE_URL", "https://api.deepgram.com").rstrip("/")
 DEEPGRAM_STT_URL = (
-    "wss://api.deepgram.com/v1/listen?"
+    f"{DEEPGRAM_STT_BASE_URL}/v1/listen?"
     "encoding=mulaw&sample_rate=8000&channels=1"
-    "&smart_formatting=true&interim_results=true&endpointing=1000"
+    "&smart_formatting=true&interim_results=true&endpointing=1000&utterance_end_ms=1000"
+)
+# Warm, authenticated STT sockets kept open so a new call does not wait on the handshake
+STT_POOL_SIZE = int(os.getenv("STT_POOL_SIZE", 2))
+# Speculative replies: start the LLM once an interim transcript has been stable this long,
+# commit if the final is within SPECULATION_MAX_DISTANCE (normalized edit distance) of it
+SPECULATIVE_LLM = os.getenv("SPECULATIVE_LLM", "1") == "1"
+SPECULATION_STABLE_MS = int(os.getenv("SPECULATION_STABLE_MS", 300))
+SPECULATION_MAX_DISTANCE = float(os.getenv("SPECULATION_MAX_DISTANCE", 0.15))
+SPECULATION_MAX_CONCURRENT = int(os.getenv("SPECULATION_MAX_CONCURRENT", 1))
+# Fragments made only of these words ("uh", a lone "i") wait for more speech before a reply;
+# comma separated, replaces the default set (utterance.FILLER_WORDS)
+UTTERANCE_FILLER_WORDS = [w.strip() for w in os.getenv("UTTERANCE_FILLER_WORDS", "").split(",") if w.strip()] or FILLER_WORDS
+# Inbound audio is coalesced into batches of this many ms before each Deepgram send
+INBOUND_BATCH_MS = min(100, max(20, int(os.getenv("INBOUND_BATCH_MS", 60))))
+# Local VAD: after this much caller silence, stop streaming audio and only send KeepAlive.
+# Must stay above endpointing + utterance_end_ms so Deepgram still sees the trailing silence.
+SILENCE_SUPPRESSION = os.getenv("SILENCE_SUPPRESSION", "1") == "1"
+SILENCE_SUPPRESS_AFTER_MS = max(2200, int(os.getenv("SILENCE_SUPPRESS_AFTER_MS", 2500)))
+# Stop playback as soon as the VAD hears the caller, before Deepgram has an interim (off: echo-prone lines)
+VAD_BARGE_IN = os.getenv("VAD_BARGE_IN", "0") == "1"
+
+DEEPGRAM_TTS_URL = f"{DEEPGRAM_TTS_BASE_URL}/v1/speak?model=aura-asteria-en&encoding=mulaw&sample_rate=8000"
+
+# Same for Deepgram TTS; a queued sentence is dropped after TTS_MAX_WAIT_MS
+TTS_RATE = float(os.getenv("TTS_RATE", 40)) / WORKERS
+TTS_MAX_CONCURRENT = max(1, int(os.getenv("TTS_MAX_CONCURRENT", 45)) // WORKERS)
+TTS_MAX_QUEUE = int(os.getenv("TTS_MAX_QUEUE", 512))
+TTS_MAX_WAIT_MS = int(os.getenv("TTS_MAX_WAIT_MS", 5000))
+# Replies are normalized to this loudness (dBFS, active speech) before playback; empty to disable
+TTS_LOUDNESS_DBFS = float(os.getenv("TTS_LOUDNESS_DBFS", -20)) if os.getenv("TTS_LOUDNESS_DBFS", "-20") else None
+
+# Shared across all calls so replies reuse warm keep-alive connections
+tts_client = TTSClient(DEEPGRAM_TTS_URL, deepgram_key, target_dbfs=TTS_LOUDNESS_DBFS)
+# Audio chunks (runs of whole frames) of one sentence buffered while the previous one plays
+TTS_PREFETCH_CHUNKS = 32
+# How far ahead of real time outbound audio is pushed into Twilio's buffer
+PLAYBACK_LEAD_SECONDS = 0.1
+
+# --------- TTS CACHE ---------
+# Memory LRU always on; set TTS_CACHE_DIR to keep synthesized prompts across restarts
+tts_cache = TTSCache(
+    DEEPGRAM_TTS_URL,
+    max_bytes=int(os.getenv("TTS_CACHE_MAX_BYTES", 8 * 1024 * 1024)),
+    disk_dir=os.getenv("TTS_CACHE_DIR"),
+    variant=f"loudness={TTS_LOUDNESS_DBFS}" if TTS_LOUDNESS_DBFS is not None else "",
+    shared=store_writer if store.remote else None,
+)
+
+# Lines the assistant repeats on most calls, synthesized at startup ("|" separated override)
+TTS_PREWARM_PROMPTS = [p.strip() for p in os.getenv("TTS_PREWARM_PROMPTS", "").split("|") if p.strip()] or [
+    "I am having trouble processing your request.",
+    "I'm here to help.",
+    "What is the emergency?",
+    "What is your location?",
+    "Please be as specific as possible.",
+    "I can help with that.",
+    "Please tell me your location or address so I can get help to you.",
+    "Is the person breathing?",
+    "Stay on the line.",
+] + FALLBACK_PROMPTS
+
+# --------- CALL RECORDING ---------
+# With RECORDING_DIR set, both directions of every call go into a fixed-size ring file
+# (RECORDING_SECONDS of audio, oldest overwritten first), written out as <streamSid>.wav
+# in the background once the call ends. RECORDING_KEEP_RING keeps the ring file for replay.
+RECORDING_DIR = os.getenv("RECORDING_DIR")
+RECORDING_SECONDS = float(os.getenv("RECORDING_SECONDS", 900))
+RECORDING_KEEP_RING = os.getenv("RECORDING_KEEP_RING", "0") == "1"
+if RECORDING_DIR:
+    os.makedirs(RECORDING_DIR, exist_ok=True)
+# File names come from the streamSid, which the socket's client sends; only Twilio-shaped ids are recorded
+STREAM_SID = re.compile(r"MZ[0-9a-fA-F]{32}")
+finalizing = set()  # recordings still being written out
+
+# --------- METRICS ---------
+registry = Registry()
+# With several workers a scrape lands on any one of them, so each worker keeps a snapshot of
+# its metrics in METRICS_DIR and /metrics sums them. The default directory is per server run
+# (keyed by the process that started the workers).
+METRICS_DIR = os.getenv("METRICS_DIR") or os.path.join(tempfile.gettempdir(), f"voice-metrics-{os.getppid()}")
+worker_metrics = WorkerMetrics(registry, METRICS_DIR) if WORKERS > 1 else None
+m_active_calls = registry.gauge("voice_active_calls", "Twilio media streams currently connected")
+m_ttfa = registry.histogram("voice_time_to_first_audio_seconds", "Final transcript to first media frame sent")
+m_turn = registry.histogram("voice_turn_seconds", "Final transcript to last media frame sent")
+m_llm_first = registry.histogram("voice_llm_first_token_seconds", "LLM request sent to first token")
+m_llm_total = registry.histogram("voice_llm_total_seconds", "LLM request sent to last token")
+m_llm_fallbacks = registry.counter("voice_llm_fallbacks_total", "Turns answered with a canned reply, by reason")
+m_llm_wait = registry.histogram("voice_llm_queue_wait_seconds", "Time a Gemini request waited for admission")
+m_tts_wait = registry.histogram("voice_tts_queue_wait_seconds", "Time a TTS request waited for admission")
+m_shed = registry.counter("voice_sched_shed_total", "Requests shed by admission control, by provider, priority and reason")
+llm_scheduler = Scheduler(
+    "llm", LLM_RATE, 2 * LLM_RATE, LLM_MAX_CONCURRENT, max_queue=LLM_MAX_QUEUE, max_wait=LLM_DEADLINE_MS / 1000,
+    on_wait=lambda seconds, _: m_llm_wait.observe(seconds),
+    on_shed=lambda priority, reason: m_shed.inc(provider="llm", priority=priority.name.lower(), reason=reason),
+)
+tts_scheduler = Scheduler(
+    "tts", TTS_RATE, 2 * TTS_RATE, TTS_MAX_CONCURRENT, max_queue=TTS_MAX_QUEUE, max_wait=TTS_MAX_WAIT_MS / 1000,
+    on_wait=lambda seconds, _: m_tts_wait.observe(seconds),
+    on_shed=lambda priority, reason: m_shed.inc(provider="tts", priority=priority.name.lower(), reason=reason),
 )
+for _sched in (llm_scheduler, tts_scheduler):
+    registry.gauge(f"voice_{_sched.name}_queued", f"Requests waiting for {_sched.name} admission",
+                   lambda _sched=_sched: _sched.queued)
+    registry.gauge(f"voice_{_sched.name}_in_flight", f"Admitted {_sched.name} requests still running",
+                   lambda _sched=_sched: _sched.active)
+llm = HedgedLLM(
+    client, LLM_MODEL,
+    lambda: prompt_cache.config(**LLM_GENERATION),
+    limiter=llm_scheduler,
+    deadline=LLM_DEADLINE_MS / 1000,
+    stall_timeout=LLM_DEADLINE_MS / 1000,
+    hedge_quantile=LLM_HEDGE_QUANTILE,
+    hedge_min=LLM_HEDGE_MIN_MS / 1000,
+    hedge_max=LLM_HEDGE_MAX_MS / 1000,
+    retries=LLM_RETRIES,
+)
+registry.counter("voice_llm_requests_total", "Gemini requests sent, hedges and retries included", lambda: llm.requests)
+registry.counter("voice_llm_hedges_total", "Hedge requests fired for a slow first token", lambda: llm.hedges)
+registry.counter("voice_llm_hedge_wins_total", "Turns answered by the hedge request", lambda: llm.hedge_wins)
+registry.counter("voice_llm_retries_total", "Gemini requests retried after a retryable error", lambda: llm.retried)
+registry.counter("voice_llm_timeouts_total", "Turns whose LLM deadline expired", lambda: llm.timeouts)
+
+# --------- INCIDENT EXTRACTION ---------
+# Extractor/verifier keep a per-call incident record current in the background, at the
+# lowest Gemini priority; the reply path never waits on it
+INCIDENT_EXTRACTION = os.getenv("INCIDENT_EXTRACTION", "1") == "1"
+incident_agent = agents(client, admission=lambda: llm_scheduler.slot(Priority.BACKGROUND))
+m_incident_rounds = registry.counter("voice_incident_rounds_total", "Incremental extract + verify rounds completed")
+m_incident_errors = registry.counter("voice_incident_errors_total", "Incremental extraction rounds that failed")
+for _stat, _help in (
+    ("requests", "Extractor/verifier Gemini requests, repairs included"),
+    ("prompt_tokens", "Extractor/verifier prompt tokens"),
+    ("output_tokens", "Extractor/verifier output tokens"),
+    ("parse_failures", "Extractor/verifier replies that failed schema validation"),
+    ("repair_failures", "Extractor/verifier replies still invalid after the repair retry"),
+):
+    registry.counter(f"voice_incident_{_stat}_total", _help, lambda _stat=_stat: incident_agent.stats[_stat])
+m_tts_first = registry.histogram("voice_tts_first_byte_seconds", "TTS request to first audio frame, per sentence")
+m_errors = registry.counter("voice_errors_total", "Errors by pipeline stage")
+m_barge_ins = registry.counter("voice_barge_ins_total", "Replies cut short because the caller spoke")
+m_inbound_frames = registry.counter("voice_inbound_frames_total", "Twilio media frames received")
+m_stt_sends = registry.counter("voice_stt_sends_total", "Batched audio sends to Deepgram")
+m_stt_bytes = registry.counter("voice_stt_audio_bytes_total", "Caller audio bytes streamed to Deepgram")
+m_stt_suppressed = registry.counter("voice_stt_suppressed_bytes_total", "Caller audio bytes held back as silence")
+m_vad_speech = registry.counter("voice_vad_speech_starts_total", "Caller speech onsets detected by the local VAD")
+m_stt_segments = registry.counter("voice_stt_final_segments_total", "Deepgram is_final segments received")
+m_turns = registry.counter("voice_turns_dispatched_total", "Caller turns sent to the LLM after merging segments")
+m_prompt_tokens = registry.counter("voice_llm_prompt_tokens_total", "Prompt tokens billed by Gemini")
+m_cached_tokens = registry.counter("voice_llm_cached_tokens_total", "Prompt tokens served from the context cache")
+m_spec_started = registry.counter("voice_speculations_started_total", "LLM requests started on stable interims")
+m_spec_hits = registry.counter("voice_speculation_hits_total", "Speculative replies committed on the final transcript")
+m_spec_wasted = registry.counter("voice_speculations_wasted_total", "Speculative replies cancelled")
+m_spec_wasted_tokens = registry.counter("voice_speculation_wasted_tokens_total",
+                                        "Prompt + output tokens spent on cancelled speculations (as billed, else estimated)")
+m_stt_connect = registry.histogram("voice_stt_connect_seconds", "Deepgram STT websocket connect time")
+stt_pool = STTPool(DEEPGRAM_STT_URL, deepgram_key, size=STT_POOL_SIZE, on_connect=m_stt_connect.observe)
+registry.counter("voice_stt_pool_hits_total", "Calls that got a pre-warmed STT socket", lambda: stt_pool.hits)
+registry.counter("voice_stt_pool_misses_total", "Calls that had to dial STT on demand", lambda: stt_pool.misses)
+registry.gauge("voice_stt_pool_idle", "Pre-warmed STT sockets waiting for a call", lambda: len(stt_pool))
+registry.gauge("voice_call_sessions", "Call sessions held in memory", lambda: len(sessions))
+m_recordings = registry.counter("voice_recordings_total", "Call recordings written out as WAV")
+m_recorded_seconds = registry.counter("voice_recorded_seconds_total", "Seconds of call audio written out as WAV")
+registry.gauge("voice_recordings_finalizing", "Call recordings still being written out", lambda: len(finalizing))
+registry.gauge("voice_store_pending", "Shared store writes waiting to be sent", lambda: store_writer.depth)
+registry.counter("voice_store_writes_total", "Shared store writes sent", lambda: store_writer.written)
+registry.counter("voice_store_write_failures_total", "Shared store writes that failed", lambda: store_writer.failed)
+registry.counter("voice_store_writes_dropped_total", "Shared store writes dropped with the queue full",
+                 lambda: store_writer.dropped)
+registry.gauge("voice_call_log_queue_depth", "Records waiting for the call log writer", lambda: call_log.depth)
+registry.counter("voice_call_log_dropped_total", "Call log records dropped on overflow", lambda: call_log.dropped)
+registry.gauge("voice_tts_cache_bytes", "Audio bytes held in the TTS memory cache", lambda: tts_cache.size_bytes)
+for _stat in ("hits", "disk_hits", "shared_hits", "shared_errors", "misses", "evictions"):
+    registry.counter(f"voice_tts_cache_{_stat}_total", f"TTS cache {_stat.replace('_', ' ')}",
+                   lambda _stat=_stat: tts_cache.stats[_stat])
 
-DEEPGRAM_TTS_URL = "https://api.deepgram.com/v1/speak?model=aura-asteria-en&encoding=mulaw&sample_rate=8000"
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    call_log.start()
+    store_writer.start()
+    stt_pool.start()
+    if worker_metrics:
+        worker_metrics.start()
+    prewarm = asyncio.create_task(tts_cache.prewarm(TTS_PREWARM_PROMPTS, synthesize))
+    sweeper = asyncio.create_task(sessions.sweep())
+    prompt_cache.start()
+    yield
+    prewarm.cancel()
+    sweeper.cancel()
+    await prompt_cache.aclose()
+    await stt_pool.aclose()
+    await tts_client.aclose()
+    print(f"TTS cache stats: {tts_cache.stats}")
+    if finalizing:
+        await asyncio.gather(*finalizing, return_exceptions=True)
+    await call_log.aclose()
+    print(f"Call log: {call_log.written} records written, {call_log.dropped} dropped")
+    await store_writer.aclose()
+    await store.aclose()
+    if worker_metrics:
+        await worker_metrics.aclose()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 @app.get("/", response_class=JSONResponse)
 async def index_page():
     return {"message": "Server is up and running"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_page():
+    body = await worker_metrics.render() if worker_metrics else registry.render()
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
 @app.api_route("/incoming_call", methods=["GET", "POST"])
 async def handle_incoming_call(request: Request):
+    # Twilio opens the media stream after the greeting; have an STT socket ready by then
+    stt_pool.reserve()
     response = VoiceResponse()
     response.say(
         "Welcome to the Emergency Helpline. "
@@ -76,7 +338,9 @@ async def handle_incoming_call(request: Request):
         "Please describe your emergency after the beep and stay on the line."
     )
     connect_verb = Connect()
-    connect_verb.stream(url=f"wss://{SERVER_DOMAIN}/audio_stream")
+    # Behind ngrok or a load balancer the public host is in X-Forwarded-Host
+    domain = SERVER_DOMAIN or request.headers.get("x-forwarded-host") or request.headers.get("host")
+    connect_verb.stream(url=f"wss://{domain}/audio_stream")
     response.append(connect_verb)
     return HTMLResponse(content=str(response), media_type="application/xml")
 
@@ -84,49 +348,132 @@ async def handle_incoming_call(request: Request):
 async def audio_stream_endpoint(websocket: WebSocket):
     print("Twilio client connected")
     await websocket.accept()
-    log_start_call()
+    trace = CallTrace()
     stream_sid = None
+    framer = None
+    session = None
+    speculator = None
+    incident = None
+    recorder = None
+    playback = PlaybackTracker()
+    utterances = UtteranceAssembler(UTTERANCE_FILLER_WORDS)
+    turn_task = None
 
-    deepgram_headers = {"Authorization": f"Token {deepgram_key}"}
-    
     try:
-        dg_ws = await connect(
-            DEEPGRAM_STT_URL,
-            additional_headers=deepgram_headers,
-        )
+        dg_ws = await stt_pool.claim()
         print("Connected to Deepgram STT")
     except Exception as e:
         print(f"Failed to connect to Deepgram: {e}")
+        m_errors.inc(stage="stt_connect")
         await websocket.close()
         return
 
+    m_active_calls.inc()
+
     async def twilio_to_deepgram():
-        nonlocal stream_sid
+        nonlocal stream_sid, framer, session, speculator, incident, recorder
+        gate = SilenceGate(dg_ws.send, suppress_after=SILENCE_SUPPRESS_AFTER_MS / 1000,
+                           on_speech_start=on_speech_start)
+        stt_send = gate if SILENCE_SUPPRESSION else dg_ws.send
+
+        async def record_and_send(audio):
+            # Recorded before the silence gate: the recording keeps everything the caller's line carried
+            if recorder:
+                recorder.inbound(audio)
+            await stt_send(audio)
+
+        batcher = InboundBatcher(record_and_send if RECORDING_DIR else stt_send, INBOUND_BATCH_MS)
         try:
             while True:
                 msg = await websocket.receive_text()
+                # Fast path: ~50 media events per second, no dict needed for them
+                payload = media_payload(msg)
+                if payload is not None:
+                    await batcher.add(payload)
+                    continue
+
                 data = json.loads(msg)
                 event = data.get("event")
 
                 if event == "start":
                     stream_sid = data["start"]["streamSid"]
+                    if RECORDING_DIR and not (isinstance(stream_sid, str) and STREAM_SID.fullmatch(stream_sid)):
+                        print(f"Not recording {stream_sid!r}: not a Twilio streamSid")
+                    elif RECORDING_DIR:
+                        recorder = CallRecorder(os.path.join(RECORDING_DIR, f"{stream_sid}.rec"), RECORDING_SECONDS)
+                    framer = MediaFramer(websocket.send_text, stream_sid, lead=PLAYBACK_LEAD_SECONDS,
+                                         tap=recorder.outbound if recorder else None)
+                    playback.framer = framer
+                    session = sessions.create(stream_sid)
+                    if SPECULATIVE_LLM:
+                        speculator = Speculator(
+                            lambda text: speculate(session, text),
+                            stable_for=SPECULATION_STABLE_MS / 1000,
+                            max_distance=SPECULATION_MAX_DISTANCE,
+                            max_concurrent=SPECULATION_MAX_CONCURRENT,
+                        )
+                    if INCIDENT_EXTRACTION:
+                        incident = IncidentTracker(incident_agent, on_update=on_incident_update)
                     print(f"Stream started: {stream_sid}")
+                    call_log.log(stream_sid, "call", event="start")
                 elif event == "media":
-                    payload = data["media"]["payload"]
-                    audio_bytes = base64.b64decode(payload)
-                    await dg_ws.send(audio_bytes)
+                    await batcher.add(data["media"]["payload"])
+                elif event == "mark":
+                    playback.on_mark(data["mark"]["name"])
                 elif event == "stop":
                     print("Twilio sent stop event")
                     break
         except Exception as e:
             print(f"Twilio error: {e}")
+            m_errors.inc(stage="twilio")
+            trace.errors += 1
         finally:
             try:
+                await batcher.flush()
                 await dg_ws.send(json.dumps([]))
             except:
                 pass
+            m_inbound_frames.inc(batcher.frames)
+            m_stt_sends.inc(batcher.batches)
+            if SILENCE_SUPPRESSION:
+                m_stt_bytes.inc(gate.sent_bytes)
+                m_stt_suppressed.inc(gate.suppressed_bytes)
+
+    def on_incident_update(tracker: IncidentTracker):
+        # Critical calls jump the LLM/TTS queues from their next turn on
+        if tracker.critical and session and not session.critical:
+            session.critical = True
+            sessions.publish(session)
+            print(f"[Incident] call classified critical: {tracker.record.get('emergency_type')}")
+        call_log.log(stream_sid, "incident", record=tracker.snapshot())
+        store_writer.put(f"incident:{stream_sid}", tracker.snapshot(), SHARED_TTL)
+
+    async def on_speech_start():
+        m_vad_speech.inc()
+        if VAD_BARGE_IN and playback.playing:
+            await barge_in("caller speech detected")
+
+    async def barge_in(reason: str):
+        """Cancel the in-flight turn and flush whatever Twilio still has buffered."""
+        interrupted = turn_task is not None and not turn_task.done()
+        if interrupted:
+            turn_task.cancel()
+            await asyncio.wait([turn_task])
+        if not (interrupted or playback.playing) or not stream_sid:
+            return
+        await websocket.send_text(json.dumps({"event": "clear", "streamSid": stream_sid}))
+        framer.reset()
+        if recorder:
+            recorder.clear()
+        unplayed = playback.clear()
+        print(f"[Barge-in] {reason}")
+        m_barge_ins.inc()
+        trace.barge_ins += 1
+        if unplayed:
+            call_log.log(stream_sid, "assistant", " ".join(unplayed), event="not_played")
 
     async def deepgram_to_llm_and_tts():
+        nonlocal turn_task
         try:
             async for message in dg_ws:
                 try:
@@ -134,82 +481,354 @@ async def audio_stream_endpoint(websocket: WebSocket):
                 except:
                     continue
 
-                if "channel" not in data: continue
-                
-                transcript = data["channel"]["alternatives"][0].get("transcript", "").strip()
-                is_final = data.get("is_final", False)
-
-                if not transcript: continue
-
-                if is_final:
-                    print(f"[User] {transcript}")
-                    log_to_file("User", transcript)
-
-                    # 1. Call LLM (ASYNC NOW - Prevents Timeout)
-                    reply_text = await call_llm(transcript)
-                    
-                    # 2. Post-process text to remove Markdown
-                    clean_reply = re.sub(r'[*_#]', '', reply_text).strip()
-                    
-                    print(f"[AI] {clean_reply}")
-                    log_to_file("AI", clean_reply)
-
-                    # 3. TTS
-                    try:
-                        audio_bytes = await tts_to_audio(clean_reply)
-                    except Exception as e:
-                        print(f"TTS Error: {e}")
+                received = time.monotonic()
+                if data.get("type") == "UtteranceEnd":
+                    utterance = utterances.end_of_speech()
+                elif data.get("type", "Results") != "Results":
+                    continue
+                else:
+                    transcript = data["channel"]["alternatives"][0].get("transcript", "").strip()
+                    is_final = data.get("is_final", False)
+                    speech_final = data.get("speech_final", False)
+
+                    if not transcript:
+                        # speech_final can arrive on an empty segment after trailing silence
+                        if not (is_final and speech_final): continue
+                        utterance = utterances.end_of_speech()
+                    elif not is_final:
+                        # Caller talking over the reply: stop it instead of letting it play out
+                        if playback.playing and utterances.has_content(transcript):
+                            await barge_in("caller speaking during playback")
+                        if speculator:
+                            speculator.on_interim(f"{utterances.pending} {transcript}".strip())
                         continue
+                    else:
+                        print(f"[User] {transcript}")
+                        m_stt_segments.inc()
+                        utterance = utterances.add(transcript, speech_final)
+                        # A newer final makes any reply still being generated or played stale,
+                        # unless it is only a held filler ("uh") that nothing would replace
+                        if utterance is not None or utterances.has_content(transcript):
+                            await barge_in("new caller utterance")
 
-                    # 4. Send Audio
-                    if stream_sid:
-                        chunk_size = 160
-                        for i in range(0, len(audio_bytes), chunk_size):
-                            chunk = audio_bytes[i : i + chunk_size]
-                            payload = base64.b64encode(chunk).decode("utf-8")
-                            await websocket.send_text(json.dumps({
-                                "event": "media",
-                                "streamSid": stream_sid,
-                                "media": {"payload": payload},
-                            }))
-                        
-                        # Mark end so Twilio knows to listen again
-                        await websocket.send_text(json.dumps({
-                            "event": "mark",
-                            "streamSid": stream_sid,
-                            "mark": {"name": "end-tts"}
-                        }))
+                # Nothing to answer yet: the caller is mid-sentence or only said a fragment
+                if utterance is None: continue
+
+                m_turns.inc()
+                print(f"[Turn] {utterance}")
+                call_log.log(stream_sid, "user", utterance, segments=utterances.last_merged)
+
+                # Stream LLM -> sentence TTS -> Twilio (first sentence plays while the rest generates)
+                if framer:
+                    turn = trace.new_turn()
+                    turn.stamps["final"] = received
+                    speculative = speculator.commit(utterance) if speculator else None
+                    session.add_user(utterance)
+                    if incident:
+                        incident.submit(utterance)
+                    turn_task = asyncio.create_task(
+                        speak_turn(websocket, framer, session, playback, turn, speculative,
+                                   priority=turn_priority(session))
+                    )
 
         except Exception as e:
             print(f"Processing error: {e}")
+            m_errors.inc(stage="stt")
+            trace.errors += 1
+
+    try:
+        await asyncio.gather(twilio_to_deepgram(), deepgram_to_llm_and_tts())
+    finally:
+        if turn_task is not None:
+            turn_task.cancel()
+        if speculator:
+            speculator.cancel_all()
+            m_spec_started.inc(speculator.started)
+            m_spec_hits.inc(speculator.hits)
+            m_spec_wasted.inc(speculator.wasted)
+            m_spec_wasted_tokens.inc(speculator.wasted_tokens)
+        await dg_ws.close()
+        m_active_calls.dec()
+        sessions.close(stream_sid)
+        fields = {}
+        if incident:
+            await incident.aclose()
+            m_incident_rounds.inc(incident.rounds)
+            m_incident_errors.inc(incident.errors)
+            fields["incident"] = incident.snapshot()
+        call_log.log(stream_sid, "call", event="stop", stt_segments=utterances.segments, **trace.summary(), **fields)
+        if recorder:
+            recorder.close()
+            finish_recording(stream_sid, recorder)
 
-    await asyncio.gather(twilio_to_deepgram(), deepgram_to_llm_and_tts())
+def finish_recording(stream_sid: str, recorder: CallRecorder):
+    """Write the call's ring file out as WAV in a thread; nobody on the call waits for it."""
+    wav_path = os.path.join(RECORDING_DIR, f"{stream_sid}.wav")
 
-# FIXED ASYNC FUNCTION
-async def call_llm(user_text: str) -> str:
+    async def run():
+        try:
+            seconds = await asyncio.to_thread(finalize, recorder.path, wav_path, RECORDING_KEEP_RING)
+            m_recordings.inc()
+            m_recorded_seconds.inc(seconds)
+            call_log.log(stream_sid, "recording", path=wav_path, seconds=round(seconds, 1))
+        except Exception as e:
+            print(f"Recording finalize failed for {stream_sid}: {e}")
+            m_errors.inc(stage="recording")
+
+    task = asyncio.create_task(run())
+    finalizing.add(task)
+    task.add_done_callback(finalizing.discard)
+
+def turn_priority(session: CallSession) -> Priority:
+    if session.critical:
+        return Priority.CRITICAL
+    if not any(role == "model" for role, _ in session.history):
+        return Priority.FIRST_TURN
+    return Priority.NORMAL
+
+# --------- STREAMING TURN PIPELINE ---------
+# Split after . ! ? but not after list numbers like "1." so numbered steps stay whole
+SENTENCE_END = re.compile(r'(?<=[.!?])(?<!\b\d\.)\s+|\n+')
+def strip_markdown(text: str) -> str:
+    return re.sub(r'[*_#`]', '', text)
+
+async def stream_llm(contents, turn: TurnTrace | None = None, priority: Priority = Priority.NORMAL):
+    """Yield reply text chunks as Gemini generates them, or a canned reply if it can't in time."""
+    turn = turn or TurnTrace()
+    produced = False
+    reason = None
     try:
-        # USE .aio FOR ASYNC (Non-blocking)
-        response = await client.aio.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=user_text,
-            config=types.GenerateContentConfig(
-                system_instruction=SYSTEM_MESSAGE,
-                max_output_tokens=150,
-                temperature=0.2,
-            )
-        )
-        return response.text
+        turn.mark("llm_request")
+        usage = None
+        async with aclosing(llm.stream(contents, priority=priority)) as stream:
+            async for chunk in stream:
+                usage = turn.usage = chunk.usage_metadata or usage
+                if chunk.text:
+                    if not produced:
+                        turn.mark("llm_first_token")
+                        m_llm_first.observe(turn.span("llm_request", "llm_first_token"))
+                    produced = True
+                    yield chunk.text
+        turn.mark("llm_last_token")
+        m_llm_total.observe(turn.span("llm_request", "llm_last_token"))
+        if usage:
+            m_prompt_tokens.inc(usage.prompt_token_count or 0)
+            m_cached_tokens.inc(usage.cached_content_token_count or 0)
+    except LLMTimeout as e:
+        print(f"LLM deadline: {e}")
+        reason = "timeout"
+    except Overloaded as e:
+        print(f"LLM shed: {e}")
+        reason = "shed"
     except Exception as e:
         print(f"LLM Error: {e}")
-        return "I am having trouble processing your request."
-
-async def tts_to_audio(text: str) -> bytes:
-    if not text: return b""
-    async with httpx.AsyncClient(timeout=10.0) as client_http:
-        r = await client_http.post(
-            DEEPGRAM_TTS_URL, 
-            headers={"Authorization": f"Token {deepgram_key}"},
-            json={"text": text}
+        m_errors.inc(stage="llm")
+        reason = "error"
+    if reason and not produced:
+        m_llm_fallbacks.inc(reason=reason)
+        turn.mark("llm_fallback")
+        # Prewarmed in the TTS cache, so this plays without waiting on synthesis
+        yield fallback_reply(caller_text(contents), first_turn=len(contents) <= 1)
+
+def caller_text(contents) -> str:
+    return " ".join(part.text or "" for c in contents if c.role == "user" for part in c.parts or [])
+
+async def stream_sentences(chunks):
+    """Regroup streamed text chunks into complete, markdown-free sentences."""
+    buf = ""
+    async for chunk in chunks:
+        buf += strip_markdown(chunk)
+        parts = SENTENCE_END.split(buf)
+        buf = parts.pop()
+        for sentence in parts:
+            if sentence.strip():
+                yield sentence.strip()
+    if buf.strip():
+        yield buf.strip()
+
+class PlaybackTracker:
+    """
+    Tracks reply audio sent to Twilio against the marks Twilio echoes back once
+    that audio has actually been played to the caller. A sentence's mark only
+    goes out after its last frame, so while it is still being framed the
+    framer's playout clock says whether the caller is hearing it.
+    """
+
+    def __init__(self, framer: MediaFramer | None = None):
+        self.framer = framer
+        self.outstanding = {}  # mark name -> sentence sent but not yet played
+        self.played = []
+        self._seq = 0
+
+    @property
+    def playing(self) -> bool:
+        return bool(self.outstanding) or (self.framer is not None and self.framer.buffered > 0)
+
+    def sent(self, sentence: str, final: bool = False) -> str:
+        self._seq += 1
+        name = f"end-tts-{self._seq}" if final else f"tts-{self._seq}"
+        self.outstanding[name] = sentence
+        return name
+
+    def on_mark(self, name: str):
+        # Marks flushed by a "clear" were already dropped in clear(), so they are ignored here
+        sentence = self.outstanding.pop(name, None)
+        if sentence:
+            self.played.append(sentence)
+
+    def clear(self) -> list:
+        unplayed = [s for s in self.outstanding.values() if s]
+        self.outstanding.clear()
+        return unplayed
+
+async def send_mark(websocket: WebSocket, stream_sid: str, name: str):
+    await websocket.send_text(json.dumps({
+        "event": "mark",
+        "streamSid": stream_sid,
+        "mark": {"name": name}
+    }))
+
+async def prefetch_tts(sentence: str, chunks: asyncio.Queue, turn: TurnTrace,
+                       priority: Priority = Priority.NORMAL):
+    """Stream one sentence's TTS audio into a bounded queue of frame runs, None when done."""
+    synthesized = None
+    try:
+        cached = await tts_cache.get(sentence)
+        if cached is not None:
+            # Hand cached clips over a second at a time, as views into the cached bytes
+            for chunk in iter_chunks(cached, FRAME_BYTES * 50):
+                await chunks.put(chunk)
+        else:
+            # Keep a copy for the cache only while the clip is small enough to be stored
+            audio = bytearray()
+            received = 0
+            backlog = []  # chunks the playback-paced queue had no room for yet
+            requested = time.monotonic()
+            async with tts_scheduler.slot(priority):
+                async for chunk in tts_client.stream(sentence):
+                    if not received:
+                        m_tts_first.observe(time.monotonic() - requested)
+                        turn.mark("tts_first_byte")
+                    received += len(chunk)
+                    if received <= tts_cache.max_entry_bytes:
+                        audio += chunk
+                    # Never wait on playback here: the slot is freed as soon as the response is read
+                    if backlog or chunks.full():
+                        backlog.append(chunk)
+                    else:
+                        chunks.put_nowait(chunk)
+            for chunk in backlog:
+                await chunks.put(chunk)
+            synthesized = bytes(audio) if received <= tts_cache.max_entry_bytes else None
+    except Exception as e:
+        print(f"TTS Error: {e}")
+        m_errors.inc(stage="tts")
+    # Not in a finally: a cancelled prefetch has no reader left and could block on a full queue
+    await chunks.put(None)
+    # Only once the sentence is handed over, so caching never holds up the next one
+    if synthesized:
+        await tts_cache.put(sentence, synthesized)
+
+def ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+def speculate(session: CallSession, text: str):
+    """Start a reply to a caller turn that Deepgram has not finalized yet."""
+    trace = TurnTrace()
+    contents = session.contents(pending=text)
+    # Billed if cancelled before Gemini reports usage: the whole request, not just the pending text
+    prompt_tokens = estimate_tokens(f"{SYSTEM_MESSAGE}\n\n{EMERGENCY_GUIDANCE}") + sum(
+        estimate_tokens(part.text or "") for c in contents for part in c.parts or [])
+    return trace, stream_llm(contents, trace, priority=turn_priority(session)), prompt_tokens
+
+async def speak_turn(websocket: WebSocket, framer: MediaFramer, session: CallSession, playback: PlaybackTracker,
+                     turn: TurnTrace, speculative: SpeculativeReply | None = None,
+                     priority: Priority = Priority.NORMAL):
+    """
+    Run one caller turn: each sentence goes to TTS as soon as the LLM finishes it,
+    and the audio is played back in order while later sentences are still generating.
+    Cancelling the task (barge-in) stops the LLM stream, pending TTS and the frame loop.
+    """
+    turn_start = turn.stamps.setdefault("final", time.monotonic())
+    stream_sid = framer.stream_sid
+    pending = asyncio.Queue()  # (sentence, audio queue, tts task) in reply order, None when done
+
+    if speculative:
+        # Already generating since before the final transcript: replay what it has, then follow it
+        turn.stamps.update({k: v for k, v in speculative.trace.stamps.items() if k.startswith("llm_")})
+        reply = speculative.replay()
+    else:
+        reply = stream_llm(session.contents(), turn, priority)
+
+    async def produce():
+        try:
+            async with aclosing(stream_sentences(reply)) as sentences:
+                async for sentence in sentences:
+                    chunks = asyncio.Queue(maxsize=TTS_PREFETCH_CHUNKS)
+                    task = asyncio.create_task(prefetch_tts(sentence, chunks, turn, priority))
+                    await pending.put((sentence, chunks, task))
+        finally:
+            await pending.put(None)
+
+    producer = asyncio.create_task(produce())
+    spoken = []
+    tts_tasks = []
+    first_sentence = None
+    first_audio = None
+    completed = False
+    try:
+        while (item := await pending.get()) is not None:
+            sentence, chunks, task = item
+            tts_tasks.append(task)
+            if first_sentence is None:
+                first_sentence = time.monotonic() - turn_start
+            print(f"[AI] {sentence}")
+            spoken.append(sentence)
+            while (chunk := await chunks.get()) is not None:
+                if first_audio is None:
+                    turn.mark("first_frame")
+                    first_audio = turn.span("final", "first_frame")
+                    m_ttfa.observe(first_audio)
+                    print(f"[Latency] time to first audio: {first_audio * 1000:.0f} ms")
+                await framer.send(chunk)
+            turn.mark_last("last_frame")
+            await send_mark(websocket, stream_sid, playback.sent(sentence))
+
+        # Mark end so Twilio knows to listen again
+        await send_mark(websocket, stream_sid, playback.sent("", final=True))
+        completed = True
+        if "last_frame" in turn.stamps:
+            m_turn.observe(turn.span("final", "last_frame"))
+    except Exception as e:
+        print(f"Turn error: {e}")
+        m_errors.inc(stage="turn")
+    finally:
+        producer.cancel()
+        while not pending.empty():
+            item = pending.get_nowait()
+            if item is not None:
+                tts_tasks.append(item[2])
+        for task in tts_tasks:
+            task.cancel()
+        if speculative:
+            speculative.cancel()
+        # What the model said (even if cut short) is context for its next reply
+        session.add_model(" ".join(spoken))
+        call_log.log(
+            stream_sid, "assistant", " ".join(spoken),
+            event="reply" if completed else "interrupted",
+            llm_first_token_ms=ms(turn.span("final", "llm_first_token")),
+            first_sentence_ms=ms(first_sentence),
+            tts_first_byte_ms=ms(turn.span("final", "tts_first_byte")),
+            first_audio_ms=ms(first_audio),
+            turn_ms=ms(time.monotonic() - turn_start),
         )
-        r.raise_for_status()
-        return r.content
\ No newline at end of file
+
+async def synthesize(text: str, priority: Priority = Priority.BACKGROUND) -> bytes:
+    async with tts_scheduler.slot(priority):
+        return await tts_client.synthesize(text)
+
+if __name__ == "__main__":
+    import uvicorn
+    # Workers are separate processes, each importing this module with its own clients and pools
+    uvicorn.run("main:app", host="0.0.0.0", port=int(os.getenv("PORT", 8000)), workers=WORKERS)
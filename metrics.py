@@ -0,0 +1,295 @@
+import os
+import json
+import math
+import time
+import bisect
+import asyncio
+
+# Latency buckets in seconds, dense around the 0.2 - 2 s range a voice turn lives in
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+
+
+def _fmt(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    inner = ",".join(f'{k}="{v}"' for k, v in pairs)
+    return "{" + inner + "}"
+
+
+class Counter:
+    """Monotonic count, optionally labelled, or a callback over an existing counter."""
+
+    def __init__(self, name: str, help: str, fn=None):
+        self.name = name
+        self.help = help
+        self.type = "counter"
+        self.fn = fn
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self):
+        if self.fn:
+            yield self.name, (), self.fn()
+        for key, value in self._values.items():
+            yield self.name, key, value
+
+
+class Gauge:
+    """A settable value, or a callback read at scrape time (e.g. a queue depth)."""
+
+    def __init__(self, name: str, help: str, fn=None):
+        self.name = name
+        self.help = help
+        self.type = "gauge"
+        self.fn = fn
+        self._value = 0
+
+    def set(self, value: float):
+        self._value = value
+
+    def inc(self, amount: float = 1):
+        self._value += amount
+
+    def dec(self, amount: float = 1):
+        self._value -= amount
+
+    def value(self) -> float:
+        return self.fn() if self.fn else self._value
+
+    def samples(self):
+        yield self.name, (), self.value()
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.type = "histogram"
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self._counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float | None:
+        """Upper bucket bound holding the q-th observation (coarse, but cheap)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (math.inf,), self._counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return math.inf
+
+    def samples(self):
+        cumulative = 0
+        for bound, n in zip(self.buckets + (math.inf,), self._counts):
+            cumulative += n
+            yield f"{self.name}_bucket", (("le", _fmt(bound)),), cumulative
+        yield f"{self.name}_sum", (), self.sum
+        yield f"{self.name}_count", (), self.count
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, fn=None) -> Counter:
+        return self.register(Counter(name, help, fn))
+
+    def gauge(self, name: str, help: str, fn=None) -> Gauge:
+        return self.register(Gauge(name, help, fn))
+
+    def histogram(self, name: str, help: str, buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, buckets))
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        return _exposition((m.name, m.type, m.help, m.samples()) for m in self._metrics)
+
+    def snapshot(self) -> list:
+        """Every metric as [name, type, help, [[sample, labels, value], ...]], JSON-serializable."""
+        return [[m.name, m.type, m.help, [[name, [list(p) for p in labels], value] for name, labels, value in m.samples()]]
+                for m in self._metrics]
+
+
+def _exposition(metrics) -> str:
+    lines = []
+    for name, type, help, samples in metrics:
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {type}")
+        for sample, labels, value in samples:
+            lines.append(f"{sample}{_labels(labels)} {_fmt(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def merge_snapshots(snapshots) -> str:
+    """
+    Sum (snapshot, alive) pairs from several processes into one exposition. Counters
+    and histograms of exited processes still count, so totals never go down; gauges
+    describe the present, so only live processes' are summed.
+    """
+    merged = {}  # metric name -> (type, help, {(sample, labels): value})
+    for snapshot, alive in snapshots:
+        for name, type, help, samples in snapshot:
+            if type == "gauge" and not alive:
+                continue
+            _, _, values = merged.setdefault(name, (type, help, {}))
+            for sample, labels, value in samples:
+                key = (sample, tuple(tuple(p) for p in labels))
+                values[key] = values.get(key, 0) + value
+    return _exposition(
+        (name, type, help, ((sample, labels, value) for (sample, labels), value in values.items()))
+        for name, (type, help, values) in merged.items()
+    )
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class WorkerMetrics:
+    """
+    One /metrics for several worker processes behind one port (multiprocess-style):
+    each worker writes its registry's snapshot to <directory>/<pid>.json every
+    `interval` seconds and on shutdown, and whichever worker a scrape lands on
+    refreshes its own file and sums them all, so every scrape sees the whole server.
+    """
+
+    def __init__(self, registry: Registry, directory: str, interval: float = 2.0):
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval
+        self.path = os.path.join(directory, f"{os.getpid()}.json")
+        self._lock = asyncio.Lock()  # snapshots reach the file in the order they were taken
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await self.write()
+            except OSError as e:
+                print(f"Metrics snapshot write failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def write(self) -> list:
+        async with self._lock:
+            snapshot = self.registry.snapshot()  # on the event loop, where the metrics change
+            await asyncio.to_thread(self._write, snapshot)
+        return snapshot
+
+    def _write(self, snapshot: list):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, self.path)
+
+    async def render(self) -> str:
+        return await asyncio.to_thread(self._merge, await self.write())
+
+    def _merge(self, own: list) -> str:
+        snapshots = [(own, True)]
+        for entry in os.listdir(self.directory):
+            if not entry.endswith(".json") or os.path.join(self.directory, entry) == self.path:
+                continue
+            try:
+                with open(os.path.join(self.directory, entry)) as f:
+                    snapshots.append((json.load(f), _alive(int(entry[:-5]))))
+            except (OSError, ValueError):
+                continue  # not a worker snapshot
+        return merge_snapshots(snapshots)
+
+    async def aclose(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.write()  # this worker's final counts keep adding up after it exits
+
+
+class TurnTrace:
+    """Monotonic timestamps of one caller turn's hot-path events."""
+
+    def __init__(self):
+        self.stamps = {}
+        self.usage = None  # the LLM's usage_metadata, once it has reported any
+
+    def mark(self, event: str):
+        # First occurrence wins, so per-sentence calls only record the turn's first one
+        self.stamps.setdefault(event, time.monotonic())
+
+    def mark_last(self, event: str):
+        self.stamps[event] = time.monotonic()
+
+    def span(self, start: str, end: str) -> float | None:
+        if start in self.stamps and end in self.stamps:
+            return self.stamps[end] - self.stamps[start]
+        return None
+
+
+class CallTrace:
+    """Per-call collection of turn traces, summarized when the socket closes."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.turns = []
+        self.barge_ins = 0
+        self.errors = 0
+
+    def new_turn(self) -> TurnTrace:
+        turn = TurnTrace()
+        self.turns.append(turn)
+        return turn
+
+    def summary(self) -> dict:
+        first_audio = sorted(
+            s for s in (t.span("final", "first_frame") for t in self.turns) if s is not None
+        )
+
+        def pct(q):
+            if not first_audio:
+                return None
+            return round(first_audio[min(len(first_audio) - 1, int(q * len(first_audio)))] * 1000, 1)
+
+        return {
+            "duration_s": round(time.monotonic() - self.started, 3),
+            "turns": len(self.turns),
+            "turns_with_audio": len(first_audio),
+            "first_audio_p50_ms": pct(0.5),
+            "first_audio_p95_ms": pct(0.95),
+            "first_audio_max_ms": round(first_audio[-1] * 1000, 1) if first_audio else None,
+            "barge_ins": self.barge_ins,
+            "errors": self.errors,
+        }
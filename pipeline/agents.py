@@ -1,72 +1,362 @@
 import os
+import re
+import sys
+import uuid
+import asyncio
+from contextlib import aclosing
+from typing import Literal
 from google import genai
+from pydantic import BaseModel, Field, ValidationError
 import dotenv
 import requests
 import json
 
+# The text channel shares the voice server's LLM engine (root modules); appended, not
+# prepended, so this directory's own agents/main still win when run from here
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prompts import SYSTEM_MESSAGE, EMERGENCY_GUIDANCE, LLM_MODEL, LLM_GENERATION
+from llm import HedgedLLM, LLMTimeout, fallback_reply
+from session import SessionStore, PromptCache
+from scheduler import Scheduler, Priority, Overloaded
+
+
+# The schemas carry the structure, so prompts no longer spell out fields or examples.
+# (Gemini's response_schema does not accept default values, hence none here.)
+class IncidentRecord(BaseModel):
+    caller_name: str = Field(description="N/A if not given")
+    emergency_type: Literal["critical", "fatal", "non-fatal", "N/A"]
+    location: str = Field(description="as precise as the caller gave it, N/A if not given")
+    number_of_people_involved: int = Field(description="0 if unknown")
+    age_group: Literal["child", "adult", "senior", "N/A"]
+    immediate_dangers: str = Field(description="fire, gas leak, structural damage, traffic...; N/A if none")
+    medical_conditions: str = Field(description="N/A if none mentioned")
+    description: str = Field(description="one sentence summary of the incident")
+
+
+class Verdict(BaseModel):
+    ready_to_dispatch: bool = Field(description="information is correct and enough to dispatch emergency services")
+    follow_up_question: str = Field(description="question for the caller to get what is missing, N/A if ready")
+
+
+# Empty incident record; the extractor fills it in as the call goes on
+INCIDENT_FIELDS = {
+    "caller_name": "N/A",
+    "emergency_type": "N/A",
+    "location": "N/A",
+    "number_of_people_involved": 0,
+    "age_group": "N/A",
+    "immediate_dangers": "N/A",
+    "medical_conditions": "N/A",
+    "description": "N/A",
+}
+CRITICAL_TYPES = {"critical", "fatal", "faital"}
+
+EXTRACTOR_PROMPT = ["you are working as first person of contact at emergency helpline. extract the incident details from what the caller says. don't add hallucinate; use N/A for anything not said."]
+VERIFIER_PROMPT = ["you are working as second person of contact at emergency helpline. you verify the incident record kept by first agent against what the caller said. don't add hallucinate."]
+
+FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+
+
+def parse_model(model_cls, text):
+    """Validate model output against the schema, tolerating a Markdown fence around it."""
+    return model_cls.model_validate_json(FENCE.sub("", text or ""))
+
+
+def make_client(api_key=None):
+    """Gemini client; GEMINI_BASE_URL points it at a local fake (Unit_Testing/fake_gemini.py)."""
+    base_url = os.getenv("GEMINI_BASE_URL")
+    return genai.Client(
+        api_key=api_key or ("fake" if base_url else None),
+        http_options=genai.types.HttpOptions(base_url=base_url) if base_url else None,
+    )
+
+
 class agents:
-    def __init__(self):
+    def __init__(self, client=None, admission=None):
         dotenv.load_dotenv()
-        self.gemini_key = os.getenv("Gemini_API")
-        self.client = genai.Client(api_key=self.gemini_key)    
-    def extractor_node(self,text):
-        systemPrompt =["you are working as first person of contact at emergency helpline. you need to return plain text no bold,ittalic text, you need to  extract the information from the transcribed call recordings. don't add hallucinate and return only the information that can be configured."]
-        prompt = f""" here is the transcription of the call : {text}.
-        the output should be in json format with following fields:
-        {{
-            "caller_name": "",
-            "emergency_type": ""(faital, non-faital, crtical),
-            "location": "",
-            "number_of_people_involved": 0,
-            "age_group": ""(child, adult, senior),
-            "immediate_dangers": ""(fire, gas leak, structural damage, etc.),
-            "medical_conditions": ""(if any known medical conditions are mentioned),
-            "description": ""
-        }}
-        if observation is not found return N/A
-        Please provide the extracted information in JSON format only.
-        emergency type should be defined by you when you here the transcription.
-        here is the example:
-        {{
-        "caller_name": "John Doe",
-        "emergency_type": "critical",
-        "location": "123 Main St, Springfield",
-        "number_of_people_involved": 2, 
-        "age_group": "adult",
-        "immediate_dangers": "fire",
-        "medical_conditions": "N/A",
-        "description": "Caller reports a fire in their apartment building with two adults trapped inside."
-        }}
-        """
-        response = self.client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt,
-            config=genai.types.GenerateContentConfig(
-                system_instruction=systemPrompt,
-                max_output_tokens=300,
-                temperature=0.2,
-            )
+        self.gemini_key = os.getenv("Gemini_API") or os.getenv("GEMINI_API_KEY")
+        # The voice server passes its own client, and an admission slot factory so
+        # extraction shares (at background priority) the process-wide Gemini limits
+        self.client = client or make_client(self.gemini_key)
+        self.admission = admission
+        self.stats = {"requests": 0, "prompt_tokens": 0, "output_tokens": 0,
+                      "parse_failures": 0, "repairs": 0, "repair_failures": 0}
+
+    def _config(self, systemPrompt, model_cls):
+        return genai.types.GenerateContentConfig(
+            system_instruction=systemPrompt,
+            max_output_tokens=300,
+            temperature=0.2,
+            response_mime_type="application/json",
+            response_schema=model_cls,
         )
-        return json.loads(response.text)
-    
+
+    def _count(self, response):
+        self.stats["requests"] += 1
+        usage = response.usage_metadata
+        if usage:
+            self.stats["prompt_tokens"] += usage.prompt_token_count or 0
+            self.stats["output_tokens"] += usage.candidates_token_count or 0
+
+    def _parsed(self, model_cls, response):
+        self._count(response)
+        if isinstance(response.parsed, model_cls):
+            return response.parsed
+        return parse_model(model_cls, response.text)
+
+    @staticmethod
+    def _repair_contents(prompt, text, error):
+        return [
+            genai.types.Content(role="user", parts=[genai.types.Part(text=prompt)]),
+            genai.types.Content(role="model", parts=[genai.types.Part(text=text or "")]),
+            genai.types.Content(role="user", parts=[genai.types.Part(
+                text=f"That was not valid for the schema ({error}). Return only the corrected JSON object.")]),
+        ]
+
+    def _generate(self, model_cls, systemPrompt, prompt):
+        """Schema-constrained call with a validated parse and one repair retry."""
+        config = self._config(systemPrompt, model_cls)
+        response = self.client.models.generate_content(model=LLM_MODEL, contents=prompt, config=config)
+        try:
+            return self._parsed(model_cls, response)
+        except ValidationError as e:
+            self.stats["parse_failures"] += 1
+            self.stats["repairs"] += 1
+            response = self.client.models.generate_content(
+                model=LLM_MODEL, contents=self._repair_contents(prompt, response.text, e), config=config)
+        try:
+            return self._parsed(model_cls, response)
+        except ValidationError:
+            self.stats["repair_failures"] += 1
+            raise
+
+    async def _generate_async(self, model_cls, systemPrompt, prompt):
+        """Async twin of _generate, run inside the admission slot when one is configured."""
+        config = self._config(systemPrompt, model_cls)
+
+        async def call(contents):
+            if self.admission:
+                async with self.admission():
+                    return await self.client.aio.models.generate_content(model=LLM_MODEL, contents=contents, config=config)
+            return await self.client.aio.models.generate_content(model=LLM_MODEL, contents=contents, config=config)
+
+        response = await call(prompt)
+        try:
+            return self._parsed(model_cls, response)
+        except ValidationError as e:
+            self.stats["parse_failures"] += 1
+            self.stats["repairs"] += 1
+            response = await call(self._repair_contents(prompt, response.text, e))
+        try:
+            return self._parsed(model_cls, response)
+        except ValidationError:
+            self.stats["repair_failures"] += 1
+            raise
+
+    def extractor_node(self,text):
+        prompt = f""" here is the transcription of the call : {text}."""
+        return self._generate(IncidentRecord, EXTRACTOR_PROMPT, prompt).model_dump()
+
     def verifier_agent(self,parameters,information):
-        systemPrompt =["you are working as second person of contact at emergency helpline. you need to verify the information extracted by first agent from the transcribed call recordings. you need to  verify the information from the transcribed call recordings. don't add hallucinate and return only the information that can be configured."]
         prompt = f""" here is the information extracted by first agent : {json.dumps(parameters)}.
         here is the transcription of the call : {information}.
-        your task is to verify the information provided by first agent with respect to transcription provided.
-        your task is to send a list[]
-        first element is boolean value(True/False) that indecates wether information is correct and enough to dispatch emergency services.
-        second element is if your first element is False then ask the necessary question to caller to get the missing information else return N/A.
         """
-        response = self.client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt,
-            config=genai.types.GenerateContentConfig(
-                system_instruction=systemPrompt,
-                max_output_tokens=300,
-                temperature=0.2,
-            )
+        verdict = self._generate(Verdict, VERIFIER_PROMPT, prompt)
+        return [verdict.ready_to_dispatch, verdict.follow_up_question]
+
+    async def extractor_node_async(self,text):
+        """Async extractor_node, for batch backfills."""
+        prompt = f""" here is the transcription of the call : {text}."""
+        return (await self._generate_async(IncidentRecord, EXTRACTOR_PROMPT, prompt)).model_dump()
+
+    async def verifier_agent_async(self,parameters,information):
+        prompt = f""" here is the information extracted by first agent : {json.dumps(parameters)}.
+        here is the transcription of the call : {information}.
+        """
+        verdict = await self._generate_async(Verdict, VERIFIER_PROMPT, prompt)
+        return [verdict.ready_to_dispatch, verdict.follow_up_question]
+
+    async def extract_incremental(self, new_text, current):
+        """Update an incident record from only the caller's newest words."""
+        prompt = f""" here is the incident record so far : {json.dumps(current)}.
+        here is what the caller just said : {new_text}.
+        return the full record, keeping existing values unless the new words correct or add to them.
+        """
+        return (await self._generate_async(IncidentRecord, EXTRACTOR_PROMPT, prompt)).model_dump()
+
+    async def verify_incremental(self, record, new_text):
+        """Check whether the record is enough to dispatch."""
+        prompt = f""" here is the incident record : {json.dumps(record)}.
+        here is what the caller said most recently : {new_text}.
+        """
+        return await self._generate_async(Verdict, VERIFIER_PROMPT, prompt)
+
+
+def merge_incident(record, update):
+    """Take the fields the extractor filled in; N/A or empty never overwrites a known value."""
+    merged = dict(record)
+    for key, value in (update or {}).items():
+        if key not in INCIDENT_FIELDS or value in (None, "", "N/A", "n/a"):
+            continue
+        if key == "number_of_people_involved":
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                continue
+            if value <= 0:
+                continue
+        merged[key] = value
+    return merged
+
+
+def is_critical(record):
+    return str(record.get("emergency_type", "")).strip().lower() in CRITICAL_TYPES
+
+
+class IncidentTracker:
+    """
+    Keeps one call's incident record current in the background.
+    Each caller turn is handed to submit(), which never waits: new text is queued
+    and at most one extract + verify round is in flight per call; text that
+    arrives meanwhile is batched into the next round. Only that new text and the
+    current record are sent, never the whole transcript.
+    """
+
+    def __init__(self, agent, on_update=None):
+        self.agent = agent
+        self.on_update = on_update  # called with the record after every round
+        self.record = dict(INCIDENT_FIELDS)
+        self.ready_to_dispatch = False
+        self.follow_up_question = None
+        self._pending = []
+        self._task = None
+        self.rounds = 0
+        self.errors = 0
+
+    def submit(self, text):
+        if not text:
+            return
+        self._pending.append(text)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while self._pending:
+            new_text = " ".join(self._pending)
+            self._pending.clear()
+            try:
+                update = await self.agent.extract_incremental(new_text, self.record)
+                self.record = merge_incident(self.record, update)
+                verdict = await self.agent.verify_incremental(self.record, new_text)
+                self.ready_to_dispatch = verdict.ready_to_dispatch
+                question = verdict.follow_up_question
+                self.follow_up_question = None if question in ("", "N/A") else question
+                self.rounds += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Incident extraction error: {e}")
+                self.errors += 1
+                continue
+            if self.on_update:
+                self.on_update(self)
+
+    @property
+    def critical(self):
+        return is_critical(self.record)
+
+    def snapshot(self):
+        return {**self.record, "ready_to_dispatch": self.ready_to_dispatch,
+                "follow_up_question": self.follow_up_question}
+
+    async def aclose(self, timeout=5.0):
+        """Let the last round finish (the call is over, nobody is waiting on audio), then stop."""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except Exception:
+            pass  # timed out (and cancelled) or failed; the record stays as it was
+
+class TextAgent:
+    """
+    The text channel (/chat): same prompts, model, hedging, deadlines and fallback
+    replies as the voice line, with one rolling history per client session id.
+    """
+
+    def __init__(self, client=None):
+        dotenv.load_dotenv()
+        self.client = client or make_client(os.getenv("Gemini_API") or os.getenv("GEMINI_API_KEY"))
+        self.prompt_cache = PromptCache(self.client, LLM_MODEL, SYSTEM_MESSAGE, EMERGENCY_GUIDANCE,
+                                        min_tokens=int(os.getenv("PROMPT_CACHE_MIN_TOKENS", 4096)),
+                                        enabled=os.getenv("PROMPT_CACHE", "0") == "1")
+        self.sessions = SessionStore(
+            idle_timeout=float(os.getenv("CHAT_SESSION_IDLE_TIMEOUT", 1800)),
+            max_history_tokens=int(os.getenv("SESSION_HISTORY_TOKENS", 1200)),
         )
-        return json.loads(response.text)
+        deadline = int(os.getenv("LLM_DEADLINE_MS", 3000)) / 1000
+        rate = float(os.getenv("LLM_RATE", 25))
+        self.scheduler = Scheduler("chat", rate, 2 * rate, int(os.getenv("LLM_MAX_CONCURRENT", 64)),
+                                   max_queue=int(os.getenv("LLM_MAX_QUEUE", 256)), max_wait=deadline)
+        self.llm = HedgedLLM(
+            self.client, LLM_MODEL,
+            lambda: self.prompt_cache.config(**LLM_GENERATION),
+            limiter=self.scheduler,
+            deadline=deadline,
+            stall_timeout=deadline,
+            retries=int(os.getenv("LLM_RETRIES", 2)),
+        )
+
+    def session(self, session_id):
+        return self.sessions.get(session_id) or self.sessions.create(session_id)
+
+    async def stream(self, message, session_id):
+        """Yield reply text as it is generated; a canned reply if Gemini is slow, shed or down."""
+        session = self.session(session_id)
+        first_turn = not any(role == "model" for role, _ in session.history)
+        session.add_user(message)
+        contents = session.contents()
+        priority = Priority.FIRST_TURN if first_turn else Priority.NORMAL
+        reply = []
+        try:
+            try:
+                async with aclosing(self.llm.stream(contents, priority=priority)) as chunks:
+                    async for chunk in chunks:
+                        if chunk.text:
+                            reply.append(chunk.text)
+                            yield chunk.text
+            except (LLMTimeout, Overloaded) as e:
+                print(f"Chat LLM fallback ({type(e).__name__}): {e}")
+            except Exception as e:
+                print(f"Chat LLM error: {e}")
+            if not reply:
+                reply.append(fallback_reply(message, first_turn=first_turn))
+                yield reply[-1]
+        finally:
+            # Whatever the client saw (even cut short by a disconnect) is the model's turn
+            session.add_model("".join(reply))
+
+    async def aclose(self):
+        await self.prompt_cache.aclose()
+
+
+_text_agent = None
+
+
+def text_agent():
+    global _text_agent
+    if _text_agent is None:
+        _text_agent = TextAgent()
+    return _text_agent
+
+
+def stream_agent(message, session_id):
+    return text_agent().stream(message, session_id)
+
 
-    pass
\ No newline at end of file
+async def run_agent(message, session_id=None):
+    """Whole reply at once, for callers that do not stream. No session_id: a one-off conversation."""
+    chunks = []
+    async for text in stream_agent(message, session_id or uuid.uuid4().hex):
+        chunks.append(text)
+    return "".join(chunks)
@@ -1,3 +1,4 @@
+import uuid
 import streamlit as st
 import requests
 import json
@@ -9,6 +10,12 @@ st.set_page_config(page_title="Agentic AI Chat", layout="wide")
 # -----------------------------------
 if "messages" not in st.session_state:
     st.session_state.messages = []
+# One id per browser session keys the conversation history on the backend
+if "session_id" not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
+# One HTTP session, so every message reuses the same keep-alive connection
+if "http" not in st.session_state:
+    st.session_state.http = requests.Session()
 
 st.title("🧠 Agentic AI Chat Interface")
 
@@ -16,20 +23,30 @@ st.title("🧠 Agentic AI Chat Interface")
 BACKEND_URL = "http://localhost:8000/chat"   # FastAPI route you will build
 
 
-def send_message_to_backend(user_msg: str):
-    """Send the user's message to your Agentic pipeline."""
+def stream_from_backend(user_msg: str):
+    """Send the user's message to your Agentic pipeline, yielding reply tokens as they arrive."""
     try:
-        response = requests.post(
+        with st.session_state.http.post(
             BACKEND_URL,
-            json={"message": user_msg},
-            timeout=60
-        )
-        if response.status_code == 200:
-            return response.json().get("reply", "No response from agent.")
-        else:
-            return f"⚠️ Backend error: {response.text}"
+            json={"message": user_msg, "session_id": st.session_state.session_id},
+            stream=True,
+            timeout=(5, 30),  # connect, and longest gap between tokens
+        ) as response:
+            if response.status_code != 200:
+                yield f"⚠️ Backend error: {response.text}"
+                return
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    if event == "done":
+                        return
+                    yield json.loads(line[5:]).get("token", "")
+                elif not line:
+                    event = None
     except Exception as e:
-        return f"⚠️ Request failed: {str(e)}"
+        yield f"⚠️ Request failed: {str(e)}"
 
 
 # -----------------------------------
@@ -49,11 +66,14 @@ if user_input := st.chat_input("Type your message..."):
     with st.chat_message("user"):
         st.markdown(user_input)
 
-    # Send to backend
-    reply = send_message_to_backend(user_input)
+    # Stream from backend, rendering the reply as it grows
+    with st.chat_message("assistant"):
+        placeholder = st.empty()
+        reply = ""
+        for token in stream_from_backend(user_input):
+            reply += token
+            placeholder.markdown(reply + "▌")
+        placeholder.markdown(reply or "No response from agent.")
 
     # Add bot reply
-    st.session_state.messages.append({"role": "assistant", "content": reply})
-
-    with st.chat_message("assistant"):
-        st.markdown(reply)
+    st.session_state.messages.append({"role": "assistant", "content": reply or "No response from agent."})
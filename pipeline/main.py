@@ -1,13 +1,56 @@
+import json
+import uuid
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from agents import run_agent  # your agent pipeline
+from agents import run_agent, stream_agent, text_agent  # your agent pipeline
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    agent = text_agent()
+    sweeper = asyncio.create_task(agent.sessions.sweep())
+    agent.prompt_cache.start()
+    yield
+    sweeper.cancel()
+    await agent.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 class ChatInput(BaseModel):
     message: str
+    session_id: str | None = None  # keeps the conversation history across requests; a new one if unset
+    stream: bool = True
+
+
+def sse(data, event=None):
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data)}\n\n"
+
 
 @app.post("/chat")
 async def chat_with_agent(data: ChatInput):
-    result = await run_agent(data.message)  # your agent pipeline
-    return {"reply": result}
+    """
+    Reply as Server-Sent Events: one `data: {"token": ...}` per chunk, then `event: done`.
+    Without a session_id the request starts a conversation of its own; its id comes back
+    in the X-Session-Id header and the done event (or the JSON reply) to continue it.
+    """
+    session_id = data.session_id or uuid.uuid4().hex
+    if not data.stream:
+        return {"reply": await run_agent(data.message, session_id), "session_id": session_id}
+
+    async def events():
+        reply = []
+        async for token in stream_agent(data.message, session_id):
+            reply.append(token)
+            yield sse({"token": token})
+        yield sse({"reply": "".join(reply), "session_id": session_id}, event="done")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Session-Id": session_id},
+    )
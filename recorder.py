@@ -0,0 +1,187 @@
+import os
+import mmap
+import time
+import wave
+import struct
+
+import numpy as np
+
+from audio import ulaw_decode, SAMPLE_RATE
+
+INBOUND = 0  # caller audio, as received from Twilio
+OUTBOUND = 1  # reply audio, as sent to Twilio
+CLEAR = 2  # barge-in: outbound audio not yet played at this point was flushed
+
+# File layout: header | index ring (ENTRY per write) | audio ring (raw mulaw)
+MAGIC = b"CREC"
+HEADER = struct.Struct("<4sIQQQQd")  # magic, version, audio capacity, index slots, audio head, index count, started
+HEADER_SIZE = 64
+# t (monotonic), timeline position (samples from call start), audio ring offset (absolute), length, direction
+ENTRY = struct.Struct("<dQQIB3x")
+
+
+class CallRecorder:
+    """
+    Per-call recording of both directions into a fixed-size, memory-mapped ring file.
+    Every write copies the mulaw bytes straight into the map and packs one index
+    entry in place, so recording costs no Python buffers and memory stays constant
+    however long the call runs; past `seconds` of audio the oldest is overwritten.
+    The header is kept current, so even a crashed worker leaves a readable file.
+    Caller audio is placed on the timeline by how much has arrived (Twilio sends it
+    continuously), reply audio by when the framer schedules it to play.
+    """
+
+    def __init__(self, path: str, seconds: float = 900.0):
+        self.path = path
+        self.capacity = int(seconds * SAMPLE_RATE) * 2  # both directions
+        self.slots = int(seconds * 50) * 2  # one entry per 20 ms frame at worst
+        self._audio_start = HEADER_SIZE + self.slots * ENTRY.size
+        size = self._audio_start + self.capacity
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        os.ftruncate(self._fd, size)  # sparse: disk is only used as audio arrives
+        self._map = mmap.mmap(self._fd, size)
+        self.head = 0  # audio bytes ever written
+        self.count = 0  # index entries ever written
+        self.started = None  # monotonic time of the first caller audio
+        self.inbound_samples = 0
+        self.started_at = time.time()
+        self._write_header()
+
+    def _write_header(self):
+        HEADER.pack_into(self._map, 0, MAGIC, 1, self.capacity, self.slots, self.head, self.count, self.started_at)
+
+    def _write(self, direction: int, audio, position: int, now: float):
+        n = len(audio)
+        if n == 0 or n > self.capacity:
+            return
+        offset = self.head % self.capacity
+        start = self._audio_start + offset
+        if offset + n <= self.capacity:
+            self._map[start : start + n] = audio
+        else:
+            view = memoryview(audio)
+            split = self.capacity - offset
+            self._map[start : start + split] = view[:split]
+            self._map[self._audio_start : self._audio_start + n - split] = view[split:]
+        ENTRY.pack_into(self._map, HEADER_SIZE + (self.count % self.slots) * ENTRY.size,
+                        now, position, self.head, n, direction)
+        self.head += n
+        self.count += 1
+        self._write_header()
+
+    def _position(self, at: float) -> int:
+        return max(0, int((at - self.started) * SAMPLE_RATE)) if self.started is not None else 0
+
+    def inbound(self, audio):
+        now = time.monotonic()
+        if self.started is None:
+            self.started = now
+        self._write(INBOUND, audio, self.inbound_samples, now)
+        self.inbound_samples += len(audio)
+
+    def outbound(self, audio, play_at: float):
+        """Reply audio that starts playing at the caller at `play_at` (monotonic)."""
+        self._write(OUTBOUND, audio, self._position(play_at), time.monotonic())
+
+    def clear(self):
+        now = time.monotonic()
+        ENTRY.pack_into(self._map, HEADER_SIZE + (self.count % self.slots) * ENTRY.size,
+                        now, self._position(now), self.head, 0, CLEAR)
+        self.count += 1
+        self._write_header()
+
+    @property
+    def seconds(self) -> float:
+        return min(self.head, self.capacity) / SAMPLE_RATE
+
+    def close(self):
+        if self._map is None:
+            return
+        self._write_header()
+        self._map.close()
+        os.close(self._fd)
+        self._map = None
+
+
+class Recording:
+    """
+    Read side of a ring file, for finalizing and for offline tools: frames come
+    back as memoryviews into the map, so replay copies nothing.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.capacity, self.slots, self.head, self.count, self.started_at = \
+            HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"{path}: not a call recording")
+        self._audio_start = HEADER_SIZE + self.slots * ENTRY.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._map.close()
+
+    def entries(self) -> list:
+        """(t, position, offset, length, direction) still held by the ring, oldest first."""
+        oldest = self.head - self.capacity
+        entries = []
+        for i in range(max(0, self.count - self.slots), self.count):
+            entry = ENTRY.unpack_from(self._map, HEADER_SIZE + (i % self.slots) * ENTRY.size)
+            if entry[4] == CLEAR or entry[2] >= oldest:
+                entries.append(entry)
+        return entries
+
+    def audio(self, offset: int, length: int):
+        start = offset % self.capacity
+        view = memoryview(self._map)
+        if start + length <= self.capacity:
+            return view[self._audio_start + start : self._audio_start + start + length]
+        split = self.capacity - start
+        # Wrapped around the end of the ring: the one case that needs a copy
+        return bytes(view[self._audio_start + start :]) + bytes(view[self._audio_start : self._audio_start + length - split])
+
+    def frames(self, direction: int | None = None):
+        """Yield (t, direction, mulaw audio) in the order it was recorded."""
+        for t, _, offset, length, d in self.entries():
+            if d != CLEAR and (direction is None or d == direction):
+                yield t, d, self.audio(offset, length)
+
+    def to_wav(self, path: str):
+        """Stereo 16-bit WAV on the call's timeline: caller left, assistant right."""
+        entries = self.entries()
+        audible = [e for e in entries if e[4] != CLEAR]
+        if not audible:
+            return 0.0
+        first = min(e[1] for e in audible)
+        total = max(e[1] + e[3] for e in audible) - first
+        tracks = np.zeros((2, total), dtype=np.int16)
+        for _, position, offset, length, direction in entries:
+            at = max(0, position - first)
+            if direction == CLEAR:
+                tracks[OUTBOUND, at:] = 0  # what had not played yet was flushed
+            else:
+                tracks[direction, at : at + length] = ulaw_decode(self.audio(offset, length))
+        with wave.open(path, "wb") as f:
+            f.setnchannels(2)
+            f.setsampwidth(2)
+            f.setframerate(SAMPLE_RATE)
+            f.writeframes(tracks.T.astype("<i2").tobytes())
+        return total / SAMPLE_RATE
+
+
+def finalize(ring_path: str, wav_path: str, keep_ring: bool = False) -> float:
+    """Ring file -> WAV (blocking; run it in a thread). Returns the seconds written."""
+    with Recording(ring_path) as recording:
+        seconds = recording.to_wav(f"{wav_path}.tmp")
+    os.replace(f"{wav_path}.tmp", wav_path)
+    if not keep_ring:
+        os.remove(ring_path)
+    return seconds
@@ -0,0 +1,167 @@
+import time
+import heapq
+import asyncio
+from enum import IntEnum
+from contextlib import asynccontextmanager
+
+
+class Priority(IntEnum):
+    CRITICAL = 0  # the incident extractor classified the call as critical
+    FIRST_TURN = 1  # a new call that has not heard a reply yet
+    NORMAL = 2
+    BACKGROUND = 3  # prewarming, extraction: nobody is listening for it
+
+
+class Overloaded(Exception):
+    """A request was shed by admission control instead of being queued or run."""
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        # Under 1 token the bucket could never hold a whole one and nothing would be admitted
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Seconds until a token is available (0 if one is now)."""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "future", "enqueued")
+
+    def __init__(self, priority: int, seq: int, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.future = future
+        self.enqueued = time.monotonic()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class Scheduler:
+    """
+    Process-wide admission control for one provider (Gemini, Deepgram TTS).
+    A request runs once it holds both a rate token (`rate` per second, bursts up
+    to `burst`) and one of `max_concurrent` slots; otherwise it waits in a
+    priority queue, FIFO within a priority. When the queue is full the lowest
+    priority waiter is shed, and nobody waits longer than `max_wait`, so under a
+    surge low-priority work is dropped early and predictably instead of every
+    call slowing down together.
+    """
+
+    def __init__(self, name: str, rate: float, burst: float, max_concurrent: int,
+                 max_queue: int = 256, max_wait: float = 5.0, on_wait=None, on_shed=None):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.on_wait = on_wait  # called with (seconds waited, priority) on admission
+        self.on_shed = on_shed  # called with (priority, reason)
+        self.active = 0
+        self.admitted = 0
+        self._queue = []
+        self._seq = 0
+        self._timer = None
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for w in self._queue if not w.future.done())
+
+    @property
+    def idle(self) -> bool:
+        """Nothing waiting and a slot free: extra (e.g. hedge) requests cost nobody anything."""
+        return self.active < self.max_concurrent and not self.queued
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority = Priority.NORMAL):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, priority: Priority = Priority.NORMAL):
+        if not self._queue and self.active < self.max_concurrent and self.bucket.delay() == 0:
+            self._admit(priority, 0.0)
+            return
+        if len(self._queue) >= self.max_queue:
+            self._queue = [w for w in self._queue if not w.future.done()]
+            heapq.heapify(self._queue)
+        if len(self._queue) >= self.max_queue:
+            worst = max(self._queue)
+            if worst.priority <= priority:
+                self._shed(priority, "queue_full")
+                raise Overloaded(f"{self.name} queue full")
+            worst.future.set_exception(Overloaded(f"{self.name} queue full"))
+            self._shed(worst.priority, "queue_full")
+
+        self._seq += 1
+        waiter = _Waiter(priority, self._seq, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, waiter)
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.max_wait)
+        except asyncio.TimeoutError:
+            if self._granted(waiter):
+                return  # admitted at the last moment
+            waiter.future.cancel()
+            self._shed(priority, "timeout")
+            raise Overloaded(f"{self.name} queue wait over {self.max_wait:.1f}s")
+        except asyncio.CancelledError:
+            if self._granted(waiter):
+                self.release()
+            else:
+                waiter.future.cancel()
+            raise
+
+    @staticmethod
+    def _granted(waiter: _Waiter) -> bool:
+        f = waiter.future
+        return f.done() and not f.cancelled() and f.exception() is None
+
+    def release(self):
+        self.active -= 1
+        self._dispatch()
+
+    def _admit(self, priority, waited: float):
+        self.bucket.take()
+        self.active += 1
+        self.admitted += 1
+        if self.on_wait:
+            self.on_wait(waited, priority)
+
+    def _shed(self, priority, reason: str):
+        if self.on_shed:
+            self.on_shed(priority, reason)
+
+    def _dispatch(self):
+        while self._queue and self.active < self.max_concurrent:
+            if self._queue[0].future.done():
+                heapq.heappop(self._queue)  # timed out, cancelled or shed
+                continue
+            delay = self.bucket.delay()
+            if delay > 0:
+                if self._timer is None:
+                    self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+                return
+            waiter = heapq.heappop(self._queue)
+            self._admit(waiter.priority, time.monotonic() - waiter.enqueued)
+            waiter.future.set_result(None)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
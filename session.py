@@ -0,0 +1,259 @@
+import os
+import time
+import asyncio
+import hashlib
+from google.genai import types
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly 4 characters per token for English; good enough for a history budget
+    return len(text) // 4 + 1
+
+
+class CallSession:
+    """Rolling, token-budgeted conversation history for one call."""
+
+    def __init__(self, stream_sid: str, max_history_tokens: int = 1200):
+        self.stream_sid = stream_sid
+        self.max_history_tokens = max_history_tokens
+        self.history = []  # [(role, text)], role is "user" or "model"
+        self.critical = False  # set when the incident extractor classifies the call as critical
+        self.started = time.monotonic()
+        self.started_at = time.time()
+        self.last_active = self.started
+        self.on_change = None  # called with the session after every turn (shared store publishing)
+
+    def add_user(self, text: str):
+        self._add("user", text)
+
+    def add_model(self, text: str):
+        self._add("model", text)
+
+    def _add(self, role: str, text: str):
+        self.last_active = time.monotonic()
+        if not text:
+            return
+        # Gemini expects alternating turns; merge e.g. two caller utterances with no reply between
+        if self.history and self.history[-1][0] == role:
+            self.history[-1] = (role, f"{self.history[-1][1]} {text}")
+        else:
+            self.history.append((role, text))
+        self._trim()
+        if self.on_change:
+            self.on_change(self)
+
+    def _trim(self):
+        total = sum(estimate_tokens(text) for _, text in self.history)
+        # Drop the oldest turns first, but always keep the latest one
+        while total > self.max_history_tokens and len(self.history) > 1:
+            _, text = self.history.pop(0)
+            total -= estimate_tokens(text)
+        # History has to start with the caller
+        while self.history and self.history[0][0] != "user":
+            _, text = self.history.pop(0)
+            total -= estimate_tokens(text)
+
+    def metadata(self) -> dict:
+        """What other workers can see of this call."""
+        return {
+            "stream_sid": self.stream_sid,
+            "worker": os.getpid(),
+            "started_at": self.started_at,
+            "critical": self.critical,
+            "history": [{"role": role, "text": text} for role, text in self.history],
+        }
+
+    def contents(self, pending: str | None = None) -> list:
+        """History as Gemini contents, optionally with a not-yet-committed caller turn appended."""
+        history = list(self.history)
+        if pending:
+            if history and history[-1][0] == "user":
+                history[-1] = ("user", f"{history[-1][1]} {pending}")
+            else:
+                history.append(("user", pending))
+        return [types.Content(role=role, parts=[types.Part(text=text)]) for role, text in history]
+
+
+class SessionStore:
+    """
+    Live call sessions, removed on stop or after sitting idle for `idle_timeout` seconds.
+    A call's media stream stays on the worker that accepted it, so the session object
+    lives there; with `shared` (a store.StoreWriter) its metadata is also published
+    as call:<stream_sid>, kept `shared_ttl` seconds after the call ends.
+    """
+
+    def __init__(self, idle_timeout: float = 600.0, max_history_tokens: int = 1200,
+                 shared=None, shared_ttl: float = 3600.0):
+        self.idle_timeout = idle_timeout
+        self.max_history_tokens = max_history_tokens
+        self.shared = shared
+        self.shared_ttl = shared_ttl
+        self._sessions = {}
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def create(self, stream_sid: str) -> CallSession:
+        session = CallSession(stream_sid, self.max_history_tokens)
+        self._sessions[stream_sid] = session
+        if self.shared:
+            session.on_change = self.publish
+            self.publish(session)
+        return session
+
+    def publish(self, session: CallSession, ended: bool = False):
+        if self.shared:
+            self.shared.put(f"call:{session.stream_sid}", {**session.metadata(), "ended": ended}, self.shared_ttl)
+
+    def get(self, stream_sid: str) -> CallSession | None:
+        return self._sessions.get(stream_sid)
+
+    def close(self, stream_sid: str | None):
+        session = self._sessions.pop(stream_sid, None)
+        if session:
+            self.publish(session, ended=True)
+
+    def evict_idle(self) -> int:
+        cutoff = time.monotonic() - self.idle_timeout
+        stale = [sid for sid, s in self._sessions.items() if s.last_active < cutoff]
+        for sid in stale:
+            self.publish(self._sessions.pop(sid), ended=True)
+        self.evicted += len(stale)
+        return len(stale)
+
+    async def sweep(self, interval: float = 60.0):
+        while True:
+            await asyncio.sleep(interval)
+            if n := self.evict_idle():
+                print(f"Evicted {n} idle call sessions")
+
+
+class PromptCache:
+    """
+    The static system prompt and guidance, sent inline with every request, or
+    from a Gemini explicit context cache shared by every call when `enabled`
+    (opt-in: worth it only for prompts above the model's minimum cacheable size).
+    The cache is created and renewed by a background task (start()); turns only
+    read the result, so config() never waits on the network. The prompt is sized
+    once with count_tokens: under `min_tokens` caching is switched off for good
+    and requests keep sending it inline.
+    With `store` (a shared store.SharedStore) every worker uses the one cache the
+    first of them created, instead of each paying for its own; it is then left to
+    expire rather than deleted when a worker shuts down.
+    """
+
+    def __init__(self, client, model: str, system_instruction: str, guidance: str,
+                 ttl_seconds: int = 3600, retry_after: float = 300.0, store=None, min_tokens: int = 4096,
+                 enabled: bool = False):
+        self.client = client
+        self.model = model
+        self.system_instruction = system_instruction
+        self.guidance = guidance
+        self.ttl_seconds = ttl_seconds
+        self.retry_after = retry_after
+        self.store = store
+        self.min_tokens = min_tokens  # Gemini rejects explicit caches smaller than this
+        digest = hashlib.sha256(f"{model}\n{system_instruction}\n{guidance}".encode("utf-8")).hexdigest()[:16]
+        self.store_key = f"prompt_cache:{digest}"
+        self.enabled = enabled
+        self._name = None
+        self._expires = 0.0
+        self._task = None
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def name(self) -> str | None:
+        # Renewed a minute before expiry, so no request lands on a dead cache
+        if self._name and time.monotonic() < self._expires - 60:
+            return self._name
+        return None
+
+    async def _run(self):
+        if not await self._large_enough():
+            self.enabled = False
+            return
+        while True:
+            await asyncio.sleep(max(1.0, await self._refresh()))
+
+    async def _large_enough(self) -> bool:
+        try:
+            counted = await self.client.aio.models.count_tokens(
+                model=self.model, contents=f"{self.system_instruction}\n\n{self.guidance}"
+            )
+        except Exception as e:
+            print(f"Could not size the prompt for caching, trying anyway: {e}")
+            return True
+        if (counted.total_tokens or 0) < self.min_tokens:
+            print(f"Prompt is {counted.total_tokens} tokens, under the {self.min_tokens} token cache minimum; "
+                  "sending it inline")
+            return False
+        return True
+
+    async def _refresh(self) -> float:
+        """Adopt, create or renew the cache. Returns seconds until it needs another look."""
+        if self.store:
+            try:
+                shared = await self.store.get_json(self.store_key)
+                if shared and shared["expires"] - time.time() > 60:
+                    self._name = shared["name"]
+                    self._expires = time.monotonic() + shared["expires"] - time.time()
+                    return self._expires - 60 - time.monotonic()
+                # Only one worker creates (or renews) the cache; the rest look again shortly
+                if not await self.store.set(f"{self.store_key}:lock", str(os.getpid()), ttl=30, nx=True):
+                    return 2.0
+            except Exception as e:
+                print(f"Shared prompt cache lookup failed: {e}")
+        try:
+            cache = await self.client.aio.caches.create(
+                model=self.model,
+                config=types.CreateCachedContentConfig(
+                    display_name="emergency-helpline-prompt",
+                    system_instruction=self.system_instruction,
+                    contents=[types.Content(role="user", parts=[types.Part(text=self.guidance)])],
+                    ttl=f"{self.ttl_seconds}s",
+                ),
+            )
+            self._name = cache.name
+            self._expires = time.monotonic() + self.ttl_seconds
+            print(f"Created Gemini context cache {cache.name}")
+            created = True
+        except Exception as e:
+            print(f"Context cache unavailable, sending the prompt inline: {e}")
+            created = False
+        if self.store:
+            await self._share(created)
+        return self.ttl_seconds - 60 if created else self.retry_after
+
+    async def _share(self, created: bool):
+        try:
+            if created:
+                await self.store.set_json(self.store_key, {"name": self._name, "expires": time.time() + self.ttl_seconds},
+                                          ttl=self.ttl_seconds)
+            else:
+                # Creation failed: hold the lock so no other worker retries before we would
+                await self.store.set(f"{self.store_key}:lock", str(os.getpid()), ttl=self.retry_after)
+        except Exception as e:
+            print(f"Shared prompt cache update failed: {e}")
+
+    async def config(self, **kwargs) -> types.GenerateContentConfig:
+        """Request config for a turn; reads the current cache state only, never waits on I/O."""
+        name = self.name()
+        if name:
+            return types.GenerateContentConfig(cached_content=name, **kwargs)
+        return types.GenerateContentConfig(
+            system_instruction=f"{self.system_instruction}\n\n{self.guidance}", **kwargs
+        )
+
+    async def aclose(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._name and not self.store:
+            try:
+                await self.client.aio.caches.delete(name=self._name)
+            except Exception as e:
+                print(f"Failed to delete context cache: {e}")
+            self._name = None
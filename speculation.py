@@ -0,0 +1,139 @@
+import re
+import asyncio
+from contextlib import aclosing
+
+from session import estimate_tokens
+
+
+def normalize(text: str) -> str:
+    return " ".join(re.findall(r"[\w']+", text.lower()))
+
+
+def edit_distance(a: str, b: str) -> int:
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def normalized_distance(a: str, b: str) -> float:
+    a, b = normalize(a), normalize(b)
+    if not a and not b:
+        return 0.0
+    return edit_distance(a, b) / max(len(a), len(b))
+
+
+class SpeculativeReply:
+    """An LLM stream started early; buffered so it can be replayed if committed."""
+
+    def __init__(self, text: str, trace, chunks, prompt_tokens: int = 0):
+        self.text = text
+        self.trace = trace
+        self.prompt_tokens = prompt_tokens  # estimated, for when the LLM never reported usage
+        self.chunks = []
+        self.done = False
+        self._changed = asyncio.Event()
+        self.task = asyncio.create_task(self._fill(chunks))
+
+    async def _fill(self, chunks):
+        try:
+            async with aclosing(chunks):
+                async for chunk in chunks:
+                    self.chunks.append(chunk)
+                    self._changed.set()
+        finally:
+            self.done = True
+            self._changed.set()
+
+    async def replay(self):
+        """Everything generated so far, then the rest as it arrives."""
+        i = 0
+        while True:
+            while i < len(self.chunks):
+                yield self.chunks[i]
+                i += 1
+            if self.done:
+                return
+            self._changed.clear()
+            await self._changed.wait()
+
+    def cancel(self):
+        self.task.cancel()
+
+    def tokens(self) -> int:
+        """Prompt + output tokens spent: as Gemini reported them, else estimated."""
+        usage = self.trace.usage
+        if usage:
+            return (usage.prompt_token_count or 0) + (usage.candidates_token_count or 0)
+        return self.prompt_tokens + estimate_tokens("".join(self.chunks))
+
+
+class Speculator:
+    """
+    Starts the LLM on an interim transcript once it has stayed the same for
+    `stable_for` seconds, instead of waiting for endpointing to finalize it.
+    When the final turn arrives within `max_distance` (normalized edit distance)
+    of a speculation, that reply is committed; every other one is cancelled.
+    """
+
+    def __init__(self, launch, stable_for: float = 0.3, max_distance: float = 0.15,
+                 max_concurrent: int = 1):
+        self.launch = launch  # text -> (trace, async iterator of reply chunks, estimated prompt tokens)
+        self.stable_for = stable_for
+        self.max_distance = max_distance
+        self.max_concurrent = max_concurrent
+        self._live = []
+        self._candidate = None
+        self._timer = None
+        self.started = 0
+        self.hits = 0
+        self.wasted = 0
+        self.wasted_tokens = 0
+
+    def on_interim(self, text: str):
+        norm = normalize(text)
+        if not norm or norm == self._candidate:
+            return
+        self._candidate = norm
+        if self._timer:
+            self._timer.cancel()
+        self._timer = asyncio.create_task(self._after_stable(text))
+
+    async def _after_stable(self, text: str):
+        await asyncio.sleep(self.stable_for)
+        if any(normalize(s.text) == self._candidate for s in self._live):
+            return
+        while len(self._live) >= self.max_concurrent:
+            self._discard(self._live.pop(0))
+        trace, chunks, prompt_tokens = self.launch(text)
+        self._live.append(SpeculativeReply(text, trace, chunks, prompt_tokens))
+        self.started += 1
+
+    def commit(self, text: str) -> SpeculativeReply | None:
+        if self._timer:
+            self._timer.cancel()
+        self._candidate = None
+        best = min(self._live, key=lambda s: normalized_distance(s.text, text), default=None)
+        if best is not None and normalized_distance(best.text, text) <= self.max_distance:
+            self._live.remove(best)
+            self.hits += 1
+        else:
+            best = None
+        self.cancel_all()
+        return best
+
+    def cancel_all(self):
+        if self._timer:
+            self._timer.cancel()
+        while self._live:
+            self._discard(self._live.pop())
+
+    def _discard(self, spec: SpeculativeReply):
+        spec.cancel()
+        self.wasted += 1
+        self.wasted_tokens += spec.tokens()
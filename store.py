@@ -0,0 +1,284 @@
+import json
+import time
+import asyncio
+from abc import ABC, abstractmethod
+from urllib.parse import urlparse, unquote
+
+
+class StoreError(Exception):
+    """The shared store answered with an error, or could not be reached."""
+
+
+class SharedStore(ABC):
+    """
+    Key/value state shared by every worker process: call session metadata,
+    incident records, synthesized audio and the Gemini context cache name.
+    Values are bytes; `ttl` is in seconds. `remote` is True when the data is
+    actually visible to other processes.
+    """
+
+    remote = False
+
+    @abstractmethod
+    async def get(self, key: str) -> bytes | None:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value, ttl: float | None = None, nx: bool = False) -> bool:
+        """Store `value`; with `nx`, only if the key does not exist yet. True if it was stored."""
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str):
+        ...
+
+    async def get_json(self, key: str):
+        value = await self.get(key)
+        return None if value is None else json.loads(value)
+
+    async def set_json(self, key: str, value, ttl: float | None = None, nx: bool = False) -> bool:
+        return await self.set(key, json.dumps(value, ensure_ascii=False), ttl, nx)
+
+    async def aclose(self):
+        pass
+
+
+class MemoryStore(SharedStore):
+    """In-process backend: enough for a single worker, and the default."""
+
+    def __init__(self):
+        self._data = {}  # key -> (value, expires at or None)
+        self._sets = 0
+
+    async def get(self, key: str) -> bytes | None:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires is not None and expires <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    async def set(self, key: str, value, ttl: float | None = None, nx: bool = False) -> bool:
+        if nx and await self.get(key) is not None:
+            return False
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        self._data[key] = (bytes(value), time.monotonic() + ttl if ttl else None)
+        self._sets += 1
+        if self._sets % 1000 == 0:
+            self._purge()
+        return True
+
+    async def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def _purge(self):
+        now = time.monotonic()
+        for key in [k for k, (_, expires) in self._data.items() if expires is not None and expires <= now]:
+            del self._data[key]
+
+
+def encode_command(*args) -> bytes:
+    """A command as a RESP array of bulk strings."""
+    out = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode("utf-8")
+        elif not isinstance(arg, (bytes, bytearray, memoryview)):
+            arg = str(arg).encode("ascii")
+        out.append(b"$%d\r\n" % len(arg))
+        out.append(bytes(arg))
+        out.append(b"\r\n")
+    return b"".join(out)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    line = await reader.readuntil(b"\r\n")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode("utf-8")
+    if kind == b"-":
+        raise StoreError(rest.decode("utf-8", "replace"))
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        n = int(rest)
+        if n < 0:
+            return None
+        return (await reader.readexactly(n + 2))[:-2]
+    if kind == b"*":
+        n = int(rest)
+        if n < 0:
+            return None
+        return [await read_reply(reader) for _ in range(n)]
+    raise StoreError(f"unexpected reply {line[:40]!r}")
+
+
+class RedisStore(SharedStore):
+    """
+    Minimal Redis (RESP2) client: one connection, commands sent one at a time
+    under a lock, reconnected once on failure. Works with Redis, Valkey, or the
+    stand-in in Unit_Testing/fake_redis.py.
+    """
+
+    remote = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379, db: int = 0,
+                 password: str | None = None, timeout: float = 2.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+        self.commands = 0
+        self.errors = 0
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout
+        )
+        if self.password:
+            await self._call("AUTH", self.password)
+        if self.db:
+            await self._call("SELECT", self.db)
+
+    async def _call(self, *args):
+        self._writer.write(encode_command(*args))
+        await self._writer.drain()
+        return await asyncio.wait_for(read_reply(self._reader), self.timeout)
+
+    def _disconnect(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def execute(self, *args):
+        async with self._lock:
+            self.commands += 1
+            for attempt in range(2):
+                try:
+                    if self._writer is None:
+                        await self._connect()
+                    return await self._call(*args)
+                except StoreError:
+                    self.errors += 1
+                    raise
+                except asyncio.CancelledError:
+                    self._disconnect()  # a reply may still be on its way; it must not answer the next command
+                    raise
+                except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                    # The stream may hold half a reply now; only a fresh connection is safe
+                    self._disconnect()
+                    if attempt:
+                        self.errors += 1
+                        raise StoreError(f"redis {self.host}:{self.port}: {type(e).__name__}: {e}") from e
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.execute("GET", key)
+
+    async def set(self, key: str, value, ttl: float | None = None, nx: bool = False) -> bool:
+        args = ["SET", key, value]
+        if ttl:
+            args += ["PX", int(ttl * 1000)]
+        if nx:
+            args.append("NX")
+        return await self.execute(*args) == "OK"
+
+    async def delete(self, key: str):
+        await self.execute("DEL", key)
+
+    async def ping(self) -> bool:
+        return await self.execute("PING") == "PONG"
+
+    async def aclose(self):
+        async with self._lock:
+            self._disconnect()
+
+
+def open_store(url: str | None) -> SharedStore:
+    """memory:// (default) or redis://[:password@]host[:port][/db]."""
+    if not url or url.startswith("memory:"):
+        return MemoryStore()
+    parsed = urlparse(url)
+    if parsed.scheme != "redis":
+        raise ValueError(f"Unsupported shared store URL: {url}")
+    return RedisStore(
+        parsed.hostname or "127.0.0.1",
+        parsed.port or 6379,
+        db=int(parsed.path.strip("/") or 0),
+        password=unquote(parsed.password) if parsed.password else None,
+    )
+
+
+class StoreWriter:
+    """
+    Write-behind for state the media path publishes (session metadata, incident
+    records, synthesized audio): put() never waits, the latest value per key
+    wins, and one background task pushes pending keys to the store. Bytes are
+    stored as they are, anything else as JSON. At most `max_pending` keys wait;
+    past that new keys are dropped. A store outage costs stale data, never a
+    stalled call.
+    """
+
+    def __init__(self, store: SharedStore, max_pending: int = 1000):
+        self.store = store
+        self.max_pending = max_pending
+        self._pending = {}  # key -> (value, ttl)
+        self._wake = asyncio.Event()
+        self._task = None
+        self._closing = False
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def put(self, key: str, value, ttl: float | None = None):
+        if key not in self._pending and len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending[key] = (value, ttl)
+        self._wake.set()
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            await self._flush()
+            if self._closing:
+                return
+
+    async def _flush(self):
+        while self._pending:
+            key = next(iter(self._pending))
+            value, ttl = self._pending.pop(key)
+            try:
+                if isinstance(value, (bytes, bytearray)):
+                    await self.store.set(key, value, ttl)
+                else:
+                    await self.store.set_json(key, value, ttl)
+                self.written += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Shared store write failed for {key}: {e}")
+
+    async def aclose(self):
+        """Push whatever is still pending, then stop."""
+        self._closing = True
+        if self._task is None:
+            await self._flush()
+            return
+        self._wake.set()
+        await self._task
+        self._task = None
@@ -0,0 +1,131 @@
+import json
+import time
+import asyncio
+from collections import deque
+from websockets.asyncio.client import connect
+from websockets.protocol import State
+
+KEEPALIVE = json.dumps({"type": "KeepAlive"})
+
+
+class STTPool:
+    """
+    Small pool of already-authenticated Deepgram STT websockets.
+    The pool is topped up in the background and idle sockets are kept open with
+    KeepAlive messages, so a new call starts streaming without a TLS + websocket
+    handshake. /incoming_call reserves a socket a few seconds before Twilio
+    opens the media stream; if the pool is empty a call dials on demand.
+    """
+
+    def __init__(self, url: str, api_key: str, size: int = 2, max_size: int = 20,
+                 keepalive_interval: float = 5.0, max_age: float = 300.0,
+                 reservation_ttl: float = 30.0, on_connect=None):
+        self.url = url
+        self.headers = {"Authorization": f"Token {api_key}"}
+        self.size = size
+        self.max_size = max_size
+        self.keepalive_interval = keepalive_interval
+        self.max_age = max_age
+        self.reservation_ttl = reservation_ttl
+        self.on_connect = on_connect  # called with connect time in seconds
+        self._idle = deque()  # (websocket, opened_at)
+        self._reservations = deque()  # expiry times
+        self._wake = asyncio.Event()
+        self._task = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._idle)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def reserve(self):
+        """A call is about to connect: make sure a socket will be waiting for it."""
+        self._reservations.append(time.monotonic() + self.reservation_ttl)
+        self._wake.set()
+
+    async def claim(self):
+        if self._reservations:
+            self._reservations.popleft()
+        self._wake.set()
+        while self._idle:
+            ws, opened = self._idle.popleft()
+            if ws.state is State.OPEN and time.monotonic() - opened < self.max_age:
+                self.hits += 1
+                return ws
+            asyncio.create_task(self._discard(ws))
+        self.misses += 1
+        return await self._dial()
+
+    async def _dial(self):
+        started = time.monotonic()
+        ws = await connect(self.url, additional_headers=self.headers)
+        if self.on_connect:
+            self.on_connect(time.monotonic() - started)
+        return ws
+
+    def _target(self) -> int:
+        now = time.monotonic()
+        while self._reservations and self._reservations[0] < now:
+            self._reservations.popleft()
+        return min(self.max_size, self.size + len(self._reservations))
+
+    async def _run(self):
+        backoff = 1.0
+        while True:
+            missing = self._target() - len(self._idle)
+            if missing > 0:
+                results = await asyncio.gather(*(self._dial() for _ in range(missing)), return_exceptions=True)
+                failed = [r for r in results if isinstance(r, Exception)]
+                for ws in results:
+                    if not isinstance(ws, Exception):
+                        self._idle.append((ws, time.monotonic()))
+                if failed:
+                    print(f"STT pool failed to dial {len(failed)} connection(s): {failed[0]}")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 30.0)
+                    continue
+                backoff = 1.0
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.keepalive_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self._keepalive()
+
+    async def _keepalive(self):
+        now = time.monotonic()
+        for item in list(self._idle):
+            ws, opened = item
+            if ws.state is not State.OPEN or now - opened >= self.max_age:
+                self._drop(item)
+                continue
+            try:
+                await ws.send(KEEPALIVE)
+            except Exception:
+                self._drop(item)
+
+    def _drop(self, item):
+        try:
+            self._idle.remove(item)
+        except ValueError:
+            return  # claimed by a call in the meantime
+        asyncio.create_task(self._discard(item[0]))
+
+    async def _discard(self, ws):
+        try:
+            await ws.close()
+        except Exception:
+            pass
+
+    async def aclose(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        while self._idle:
+            ws, _ = self._idle.popleft()
+            await self._discard(ws)
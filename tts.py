@@ -0,0 +1,76 @@
+import httpx
+
+from audio import LoudnessNormalizer, normalize_ulaw
+
+# 8 kHz mulaw is 1 byte per sample, so one 20 ms Twilio media frame is 160 bytes
+FRAME_BYTES = 160
+
+
+async def reframe(chunks, frame_bytes: int = FRAME_BYTES):
+    """Regroup arbitrarily sized byte chunks into runs of whole audio frames."""
+    buf = bytearray()
+    async for chunk in chunks:
+        buf += chunk
+        whole = len(buf) - len(buf) % frame_bytes
+        if whole:
+            yield bytes(buf[:whole])
+            del buf[:whole]
+    if buf:
+        yield bytes(buf)
+
+
+class TTSClient:
+    """
+    One long-lived Deepgram TTS client per process.
+    Keeps connections alive between replies so a turn does not pay a fresh
+    TCP + TLS handshake, and streams audio instead of buffering the whole body.
+    With `target_dbfs` set, replies are loudness-normalized so every sentence
+    plays at the same level.
+    """
+
+    def __init__(self, url: str, api_key: str, max_connections: int = 50,
+                 max_keepalive: int = 20, timeout: float = 10.0, target_dbfs: float | None = None):
+        self.url = url
+        self.api_key = api_key
+        self.target_dbfs = target_dbfs
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=30.0,
+        )
+        self.timeout = timeout
+        self._http = None
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+                headers={"Authorization": f"Token {self.api_key}"},
+            )
+        return self._http
+
+    async def stream(self, text: str):
+        """Yield mulaw audio in whole 20 ms frames as soon as Deepgram sends the bytes."""
+        if not text:
+            return
+        normalizer = LoudnessNormalizer(self.target_dbfs) if self.target_dbfs is not None else None
+        async with self.http.stream("POST", self.url, json={"text": text}) as r:
+            r.raise_for_status()
+            async for chunk in reframe(r.aiter_bytes()):
+                yield normalizer.process(chunk) if normalizer else chunk
+
+    async def synthesize(self, text: str) -> bytes:
+        if not text:
+            return b""
+        r = await self.http.post(self.url, json={"text": text})
+        r.raise_for_status()
+        if self.target_dbfs is not None:
+            return normalize_ulaw(r.content, self.target_dbfs)
+        return r.content
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
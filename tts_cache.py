@@ -0,0 +1,160 @@
+import os
+import re
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qsl
+
+
+def voice_params(tts_url: str) -> str:
+    """Voice/encoding part of the TTS URL (model, encoding, sample_rate, ...) in a stable order."""
+    query = sorted(parse_qsl(urlparse(tts_url).query))
+    return "&".join(f"{k}={v}" for k, v in query)
+
+
+def normalize_text(text: str) -> str:
+    # Only whitespace is normalized; case and punctuation change how the voice reads a line
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class TTSCache:
+    """
+    Content-addressed cache of synthesized mulaw audio.
+    Memory tier is an LRU bounded by total bytes; the optional disk tier keeps
+    raw mulaw files so common prompts survive restarts. `variant` names any
+    post-processing (e.g. loudness target) so differently processed audio never
+    shares a key. The optional `shared` tier (a store.StoreWriter) lets every
+    worker process reuse audio any one of them synthesized. It sits on the reply
+    path, so a shared read gives up after `shared_timeout` seconds and a failed
+    one skips the tier for `shared_cooldown` seconds; writes go out write-behind.
+    """
+
+    def __init__(self, tts_url: str, max_bytes: int = 8 * 1024 * 1024,
+                 disk_dir: str | None = None, max_entry_bytes: int = 160_000, variant: str = "",
+                 shared=None, shared_ttl: float = 86400.0, shared_timeout: float = 0.1,
+                 shared_cooldown: float = 10.0):
+        self.params = voice_params(tts_url) + (f"|{variant}" if variant else "")
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.disk_dir = disk_dir
+        self.shared = shared
+        self.shared_ttl = shared_ttl
+        self.shared_timeout = shared_timeout
+        self.shared_cooldown = shared_cooldown
+        self._shared_down_until = 0.0
+        self._entries = OrderedDict()  # key -> audio bytes
+        self._size = 0
+        self.stats = {"hits": 0, "disk_hits": 0, "shared_hits": 0, "shared_errors": 0, "misses": 0, "evictions": 0, "stores": 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.params}\n{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.ulaw")
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get(self, text: str) -> bytes | None:
+        key = self.key(text)
+        audio = self._entries.get(key)
+        if audio is not None:
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return audio
+        if self.disk_dir:
+            audio = await asyncio.to_thread(self._read_disk, key)
+            if audio is not None:
+                self.stats["disk_hits"] += 1
+                self._remember(key, audio)
+                return audio
+        if self.shared:
+            audio = await self._read_shared(key)
+            if audio is not None:
+                self.stats["shared_hits"] += 1
+                self._remember(key, audio)
+                return audio
+        self.stats["misses"] += 1
+        return None
+
+    async def put(self, text: str, audio: bytes):
+        if not audio or len(audio) > self.max_entry_bytes:
+            return
+        key = self.key(text)
+        self._remember(key, audio)
+        self.stats["stores"] += 1
+        if self.shared:
+            self.shared.put(f"tts:{key}", audio, self.shared_ttl)
+        if self.disk_dir:
+            await asyncio.to_thread(self._write_disk, key, audio)
+
+    async def _read_shared(self, key: str) -> bytes | None:
+        if time.monotonic() < self._shared_down_until:
+            return None
+        try:
+            return await asyncio.wait_for(self.shared.store.get(f"tts:{key}"), self.shared_timeout)
+        except Exception as e:
+            self.stats["shared_errors"] += 1
+            self._shared_down_until = time.monotonic() + self.shared_cooldown
+            print(f"Shared TTS cache read failed, skipping it for {self.shared_cooldown:.0f}s: {e!r}")
+            return None
+
+    def _remember(self, key: str, audio: bytes):
+        if len(audio) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= len(old)
+        self._entries[key] = audio
+        self._size += len(audio)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self.stats["evictions"] += 1
+
+    def _read_disk(self, key: str) -> bytes | None:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_disk(self, key: str, audio: bytes):
+        # Write then rename so a crash never leaves a truncated clip behind
+        path = self._path(key)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(audio)
+        os.replace(tmp, path)
+
+    async def prewarm(self, prompts, synthesize):
+        """Synthesize any prompt that is not cached yet. Returns how many were fetched."""
+        fetched = 0
+        for text in prompts:
+            key = self.key(text)
+            if key in self._entries:
+                continue
+            if self.disk_dir:
+                audio = await asyncio.to_thread(self._read_disk, key)
+                if audio is not None:
+                    self._remember(key, audio)
+                    continue
+            if self.shared:
+                # Another worker may have synthesized it already
+                audio = await self._read_shared(key)
+                if audio is not None:
+                    self._remember(key, audio)
+                    continue
+            try:
+                await self.put(text, await synthesize(text))
+                fetched += 1
+            except Exception as e:
+                print(f"TTS prewarm failed for '{text}': {e}")
+        return fetched
@@ -0,0 +1,47 @@
+import re
+
+# Hesitations and function words that say nothing on their own ("uh", a lone "i")
+FILLER_WORDS = {
+    "uh", "um", "umm", "er", "erm", "ah", "eh", "oh", "hmm", "mm", "mhm", "hm",
+    "i", "a", "an", "the", "and", "but", "or", "so", "well", "like", "my", "it", "is",
+}
+
+
+class UtteranceAssembler:
+    """
+    Collects Deepgram is_final segments into one caller turn.
+    A turn is released on speech_final or UtteranceEnd, and only once it passes
+    the minimum-content rule. Only fragments made of filler words (a lone "i",
+    "uh") are held and prepended to the caller's next utterance; any other word,
+    however short ("Bleeding.", a street name), is answered. `filler_words`
+    replaces the default set.
+    """
+
+    def __init__(self, filler_words=FILLER_WORDS):
+        self.filler_words = {w.lower() for w in filler_words}
+        self._segments = []
+        self.segments = 0  # is_final segments received
+        self.dispatched = 0  # turns released to the LLM
+        self.last_merged = 0  # segments that went into the last turn
+
+    @property
+    def pending(self) -> str:
+        return " ".join(self._segments)
+
+    def add(self, transcript: str, speech_final: bool = False) -> str | None:
+        self._segments.append(transcript)
+        self.segments += 1
+        return self.end_of_speech() if speech_final else None
+
+    def end_of_speech(self) -> str | None:
+        text = self.pending
+        if not text or not self.has_content(text):
+            return None
+        self.last_merged = len(self._segments)
+        self._segments.clear()
+        self.dispatched += 1
+        return text
+
+    def has_content(self, text: str) -> bool:
+        words = re.findall(r"[\w']+", text.lower())
+        return any(w not in self.filler_words for w in words)
@@ -0,0 +1,122 @@
+from collections import deque
+
+import numpy as np
+
+from audio import ULAW_TO_LINEAR
+from tts import FRAME_BYTES
+from stt_pool import KEEPALIVE
+
+
+class VoiceActivityDetector:
+    """
+    Frame energy + zero-crossing VAD over 20 ms mulaw frames, vectorized with NumPy.
+    A frame is speech when its energy clears an adaptive noise floor by `margin_db`
+    and it is not noise-like (high zero-crossing rate at low energy). `hangover`
+    keeps the detector in speech for a few frames after the last speech frame so
+    short pauses between words don't toggle it.
+    """
+
+    def __init__(self, margin_db: float = 12.0, min_db: float = 30.0, zcr_max: float = 0.35,
+                 hangover_frames: int = 15):
+        self.margin_db = margin_db
+        self.min_db = min_db
+        self.zcr_max = zcr_max
+        self.hangover_frames = hangover_frames
+        self.noise_db = min_db
+        self._hangover = 0
+        self.speaking = False
+
+    def frame_features(self, audio) -> tuple:
+        """Per-frame energy (dB) and zero-crossing rate for whole 20 ms frames in `audio`."""
+        codes = np.frombuffer(audio, dtype=np.uint8)
+        n = len(codes) // FRAME_BYTES
+        pcm = ULAW_TO_LINEAR[codes[: n * FRAME_BYTES]].reshape(n, FRAME_BYTES).astype(np.float32)
+        energy_db = 10 * np.log10(np.mean(pcm * pcm, axis=1) + 1.0)
+        zcr = np.mean(np.signbit(pcm[:, 1:]) != np.signbit(pcm[:, :-1]), axis=1)
+        return energy_db, zcr
+
+    def process(self, audio) -> np.ndarray:
+        """Speech flag per frame (after hangover smoothing); updates `speaking`."""
+        energy_db, zcr = self.frame_features(audio)
+        threshold = max(self.min_db, self.noise_db + self.margin_db)
+        # Loud frames are speech whatever their ZCR; quieter ones must not look like hiss
+        raw = (energy_db > threshold) & ((zcr < self.zcr_max) | (energy_db > threshold + 10))
+        if (~raw).any():
+            # Track the noise floor on non-speech frames only, slowly
+            self.noise_db = 0.95 * self.noise_db + 0.05 * float(np.median(energy_db[~raw]))
+        flags = np.empty(len(raw), dtype=bool)
+        hangover = self._hangover
+        for i, is_speech in enumerate(raw):  # a few frames per batch; the heavy math above is vectorized
+            hangover = self.hangover_frames if is_speech else max(0, hangover - 1)
+            flags[i] = hangover > 0
+        self._hangover = hangover
+        if len(flags):
+            self.speaking = bool(flags[-1])
+        return flags
+
+
+class SilenceGate:
+    """
+    Sits between the inbound batcher and Deepgram. Audio flows while the caller
+    speaks and for `suppress_after` seconds after (long enough for endpointing and
+    UtteranceEnd to fire). Past that, audio is held back and Deepgram gets a
+    KeepAlive every `keepalive_interval` seconds. The last `preroll` seconds are
+    kept so the first syllable is not clipped when speech resumes.
+    Time is measured in audio received (8000 bytes a second), which tracks the
+    wall clock for a live call and keeps offline replays deterministic.
+    `on_speech_start` (async) is awaited whenever the caller starts talking.
+    """
+
+    def __init__(self, send, vad: VoiceActivityDetector | None = None, suppress_after: float = 2.5,
+                 keepalive_interval: float = 5.0, preroll: float = 0.3, on_speech_start=None):
+        self.send = send
+        self.vad = vad or VoiceActivityDetector()
+        self.suppress_after = suppress_after
+        self.keepalive_interval = keepalive_interval
+        self.preroll_bytes = int(preroll * 8000)
+        self.on_speech_start = on_speech_start
+        self._preroll = deque()
+        self._preroll_size = 0
+        self._clock = 0.0
+        self._last_speech = 0.0
+        self._last_keepalive = 0.0
+        self.suppressing = False
+        self.sent_bytes = 0
+        self.suppressed_bytes = 0
+        self.speech_starts = 0
+
+    async def __call__(self, audio):
+        was_speaking = self.vad.speaking
+        flags = self.vad.process(audio)
+        self._clock += len(audio) / 8000
+        now = self._clock
+        if flags.any():
+            self._last_speech = now
+            if not was_speaking:
+                self.speech_starts += 1
+                if self.on_speech_start:
+                    await self.on_speech_start()
+
+        if now - self._last_speech < self.suppress_after:
+            if self.suppressing:
+                self.suppressing = False
+                if self._preroll:
+                    held = b"".join(self._preroll)
+                    self._preroll.clear()
+                    self._preroll_size = 0
+                    self.suppressed_bytes -= len(held)
+                    self.sent_bytes += len(held)
+                    await self.send(held)
+            self.sent_bytes += len(audio)
+            await self.send(audio)
+            return
+
+        self.suppressing = True
+        self.suppressed_bytes += len(audio)
+        self._preroll.append(audio)
+        self._preroll_size += len(audio)
+        while self._preroll_size - len(self._preroll[0]) >= self.preroll_bytes:
+            self._preroll_size -= len(self._preroll.popleft())
+        if now - self._last_keepalive >= self.keepalive_interval:
+            self._last_keepalive = now
+            await self.send(KEEPALIVE)